@@ -112,7 +112,6 @@ def statistic_by_interval(values, interval, statistic='mean'):
         return temp[:, :interval, :, :].sum(axis=1)
 
 
-# TODO: this might make more sense as a loop in Cython
 def calculate_zonal_statistics(zones, zone_values, values, statistics):
     """
     Calculate zonal statistics for each zone in zones.
@@ -140,35 +139,190 @@ def calculate_zonal_statistics(zones, zone_values, values, statistics):
     if not len(values.shape) in (2, 3):
         raise ValueError('Input values expected to be 2 or 3D')
 
-    if not hasattr(values, 'mask'):
-        values = numpy.ma.masked_array(values)
+    # Statistics for all zones are tallied at once using numpy.bincount, instead of masking values for each zone
+    num_layers = values.shape[0] if len(values.shape) == 3 else 1
+    accumulator = ZonalStatisticsAccumulator(len(zone_values), num_layers)
+    accumulator.update(zones, values)
+    layer_results = accumulator.get_results(zone_values, statistics)
 
-    axis = None
-    if len(values.shape) == 3:
-        values = values.reshape(values.shape[0], values.shape[1] * values.shape[2])
-        zones = zones.flat
-        axis = 1
+    if num_layers == 1:
+        return layer_results[0]
 
+    # Combine into an array of values across layers for each zone; layers without any pixels in the zone are masked
     results = {}
-    for zone_idx, zone in enumerate(zone_values):
-        if hasattr(zone, 'item'):
-            zone = zone.item()
-
-        zone_mask = zones != zone_idx  # mask out everything that is NOT the zone
-        masked = numpy.ma.masked_array(values, mask=values.mask | zone_mask)
-
-        # skip if all pixels are masked
-        if masked.mask.min() == True:
-            continue
-
-        zone_results = dict()
+    for zone in set().union(*layer_results):
+        mask = numpy.array([zone not in layer for layer in layer_results])
+        zone_results = {}
         for statistic in statistics:
-            # Call the function dynamically
+            layer_values = [layer[zone][statistic] if zone in layer else 0 for layer in layer_results]
             if statistic == 'count':
-                zone_results[statistic] = (masked.mask == False).sum(axis=axis)
+                zone_results[statistic] = numpy.array(layer_values)
             else:
-                zone_results[statistic] = getattr(masked, statistic)(axis=axis)
+                zone_results[statistic] = numpy.ma.masked_array(layer_values, mask=mask)
 
         results[zone] = zone_results
 
-    return results
\ No newline at end of file
+    return results
+
+
+class ZonalStatisticsAccumulator(object):
+    """
+    Accumulates partial zonal statistics (count, sum, mean, sum of squared deviations, min, max) block by block, so that zonal
+    statistics can be calculated in a single pass over data without holding entire arrays in memory.
+
+    Statistics are accumulated separately for each layer (e.g., time step) of the data.  Sums of integer data are
+    accumulated as 64 bit integers, and min / max retain the dtype of the data; only mean and std are floats.
+    """
+
+    def __init__(self, num_zones, num_layers=1):
+        """
+        :param num_zones: number of zones; zone indices must be in range(num_zones)
+        :param num_layers: number of layers accumulated independently
+        """
+
+        self.num_zones = num_zones
+        self.num_layers = num_layers
+
+        size = num_zones * num_layers
+        self.count = numpy.zeros(size, dtype=numpy.int64)
+        self.mean = numpy.zeros(size, dtype=numpy.float64)
+        self.m2 = numpy.zeros(size, dtype=numpy.float64)
+
+        # Allocated based on the dtype of the first block of values
+        self.sum = None
+        self.min = None
+        self.max = None
+
+    def _allocate(self, dtype):
+        size = self.count.shape[0]
+
+        if dtype.kind in 'iu':
+            sum_dtype = numpy.uint64 if dtype.kind == 'u' and dtype.itemsize == 8 else numpy.int64
+            info = numpy.iinfo(dtype)
+            lowest, highest = info.min, info.max
+        else:
+            sum_dtype = numpy.float64
+            lowest, highest = -numpy.inf, numpy.inf
+
+        self.sum = numpy.zeros(size, dtype=sum_dtype)
+        self.min = numpy.full(size, highest, dtype=dtype)
+        self.max = numpy.full(size, lowest, dtype=dtype)
+
+    def update(self, zones, values, fill_value=None):
+        """
+        Add a block of values to the running statistics.
+
+        :param zones: 2D block of zone indices.  Masked pixels and indices >= num_zones are not assigned to any zone.
+        :param values: block of values, either 2D (single layer) or 3D with layers along the first dimension.
+        Masked pixels are excluded.
+        :param fill_value: (optional) pixels equal to this value are also excluded.  This allows values to be passed
+        in without first building a masked array.
+        """
+
+        data = numpy.ma.getdata(values)
+        mask = numpy.ma.getmask(values)
+
+        if fill_value is not None:
+            fill_mask = numpy.isnan(data) if numpy.isnan(fill_value) else data == fill_value
+            mask = fill_mask if mask is numpy.ma.nomask else mask | fill_mask
+
+        if data.dtype.kind == 'b':
+            data = data.astype(numpy.uint8)
+
+        if len(data.shape) == 2:
+            data = data.reshape((1, ) + data.shape)
+
+        if data.shape[0] != self.num_layers or data.shape[1:] != zones.shape:
+            raise ValueError('Shape of values does not match zones and number of layers')
+
+        # Offset zone indices by layer, so that all layers are tallied by a single bincount
+        zone_indices = numpy.ma.filled(zones, 0).astype(numpy.intp).ravel()
+        indices = (numpy.arange(self.num_layers, dtype=numpy.intp)[:, None] * self.num_zones + zone_indices).ravel()
+
+        # Zone indices beyond the last zone (e.g., fill values) are not assigned to any zone
+        zone_mask = zone_indices >= self.num_zones
+        if numpy.ma.getmask(zones) is not numpy.ma.nomask:
+            zone_mask |= numpy.ma.getmask(zones).ravel()
+        if mask is numpy.ma.nomask:
+            valid = ~numpy.tile(zone_mask, self.num_layers)
+        else:
+            valid = ~(mask.reshape(self.num_layers, -1) | zone_mask).ravel()
+
+        if self.sum is None:
+            self._allocate(data.dtype)
+
+        indices = indices[valid]
+        data = data.ravel()[valid]
+        float_data = data.astype(numpy.float64)
+
+        size = self.count.shape[0]
+        block_count = numpy.bincount(indices, minlength=size)
+        block_sum = numpy.bincount(indices, weights=float_data, minlength=size)
+
+        if self.sum.dtype.kind == 'f':
+            self.sum += block_sum
+        else:
+            # bincount weights are float64, which can't hold integer sums beyond 2**53 exactly
+            numpy.add.at(self.sum, indices, data.astype(self.sum.dtype))
+
+        # Squared deviations are taken from the block mean and merged into the running totals (Chan et al.), since
+        # sum of squares - mean ** 2 cancels catastrophically for data with a large mean relative to its spread
+        updated = block_count > 0
+        block_count = block_count[updated]
+        block_mean = block_sum[updated] / block_count
+        block_mean_values = numpy.zeros(size, dtype=numpy.float64)
+        block_mean_values[updated] = block_mean
+        deviations = float_data - block_mean_values[indices]
+        block_m2 = numpy.bincount(indices, weights=deviations * deviations, minlength=size)[updated]
+
+        count = self.count[updated]
+        total = count + block_count
+        delta = block_mean - self.mean[updated]
+        self.mean[updated] += delta * block_count / total
+        self.m2[updated] += block_m2 + delta * delta * count * block_count / total
+        self.count[updated] = total
+
+        numpy.minimum.at(self.min, indices, data)
+        numpy.maximum.at(self.max, indices, data)
+
+    def get_results(self, zone_values, statistics):
+        """
+        Calculate final statistics for each zone that has at least one unmasked pixel.
+
+        :param zone_values: 1D array of zone values.  Index in this list used to match the zone index.
+        :param statistics: list-like, must be one of mean, min, max, std, sum, count
+        :return: list with one dict per layer: [{zone: {statistic: value}}, ...]
+        """
+
+        if set(statistics).difference(VALID_ZONAL_STATISTICS):
+            raise ValueError('One or more statistics is not supported {0}'.format(statistics))
+
+        if self.sum is None:
+            self._allocate(numpy.dtype(numpy.float64))
+
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            std = numpy.sqrt(self.m2 / self.count)
+
+        computed = {
+            'mean': self.mean,
+            'min': self.min,
+            'max': self.max,
+            'std': std,
+            'sum': self.sum,
+            'count': self.count
+        }
+
+        zone_values = [zone.item() if hasattr(zone, 'item') else zone for zone in zone_values]
+
+        results = []
+        for layer in range(self.num_layers):
+            offset = layer * self.num_zones
+            layer_results = {}
+            for zone_idx in numpy.flatnonzero(self.count[offset:offset + self.num_zones]):
+                index = offset + zone_idx
+                layer_results[zone_values[zone_idx]] = {
+                    statistic: computed[statistic][index].item() for statistic in statistics
+                }
+            results.append(layer_results)
+
+        return results
@@ -1,6 +1,6 @@
 import numpy
 from trefoil.analysis.summary import statistic_by_interval, calculate_zonal_statistics
-from trefoil.analysis.summary import VALID_ZONAL_STATISTICS
+from trefoil.analysis.summary import VALID_ZONAL_STATISTICS, ZonalStatisticsAccumulator
 
 
 def test_sum_by_interval():
@@ -35,3 +35,64 @@ def test_calculate_zonal_stats_2d():
                 assert result[statistic] == truth.size
             else:
                 assert result[statistic] == getattr(truth, statistic)()
+
+
+def test_zonal_statistics_accumulator():
+    zones = numpy.ma.masked_array(numpy.zeros((10, 10), dtype='uint8'))
+    zones[5:] = 1
+    zones[:, 0] = numpy.ma.masked
+    zone_values = numpy.array([10, 20])
+    data = numpy.ma.masked_array(numpy.random.random((3, 10, 10)))
+    data[:, :, 9] = numpy.ma.masked
+
+    statistics = list(VALID_ZONAL_STATISTICS)
+
+    accumulator = ZonalStatisticsAccumulator(len(zone_values), num_layers=3)
+    # Accumulate in blocks; results must match calculating all at once
+    for y_slice in (slice(0, 3), slice(3, 10)):
+        accumulator.update(zones[y_slice], data[:, y_slice])
+
+    results = accumulator.get_results(zone_values, statistics)
+    assert len(results) == 3
+
+    for layer in range(3):
+        assert set(results[layer].keys()) == set(zone_values)
+        for zone_idx, zone in enumerate(zone_values):
+            values = data[layer][(zones == zone_idx).filled(False)].compressed()
+            for statistic in statistics:
+                expected = values.size if statistic == 'count' else getattr(numpy, statistic)(values)
+                assert numpy.isclose(results[layer][zone][statistic], expected)
+
+
+def test_zonal_statistics_accumulator_fill_value():
+    zones = numpy.zeros((4, 4), dtype='uint8')
+    data = numpy.arange(16, dtype='float32').reshape((4, 4))
+    data[0] = -9999
+
+    accumulator = ZonalStatisticsAccumulator(1)
+    accumulator.update(zones, data, fill_value=-9999)
+    results = accumulator.get_results([1], ['count', 'min'])[0]
+    assert results[1]['count'] == 12
+    assert results[1]['min'] == 4
+
+
+def test_zonal_statistics_accumulator_large_offset():
+    zones = numpy.zeros((10, 10), dtype='uint8')
+    data = 1e9 + numpy.random.random((10, 10)) * 0.6
+
+    accumulator = ZonalStatisticsAccumulator(1)
+    for y_slice in (slice(0, 3), slice(3, 10)):
+        accumulator.update(zones[y_slice], data[y_slice])
+
+    results = accumulator.get_results([0], ['mean', 'std'])[0]
+    assert numpy.isclose(results[0]['mean'], data.mean(), rtol=0, atol=1e-6)
+    assert numpy.isclose(results[0]['std'], data.std(), rtol=1e-6)
+
+
+def test_zonal_statistics_integer_dtype():
+    zones = numpy.zeros((2, 2), dtype='uint8')
+    data = numpy.array([[2 ** 53 + 1, 1], [2, 3]], dtype='int64')
+
+    results = calculate_zonal_statistics(zones, [0], data, ['min', 'max', 'sum'])[0]
+    assert results == {'min': 1, 'max': 2 ** 53 + 1, 'sum': 2 ** 53 + 7}
+    assert all(isinstance(value, int) for value in results.values())
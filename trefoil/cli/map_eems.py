@@ -140,7 +140,8 @@ def map_eems(
             'dst_crs': dst_crs,
             'dst_transform': dst_transform,
             'resampling': getattr(Resampling, resampling),
-            'dst_shape': (dst_height, dst_width)
+            'dst_shape': (dst_height, dst_width),
+            'num_threads': os.cpu_count() or 1
         }
 
         if not (dst_crs or src_crs):
@@ -51,7 +51,7 @@ def mask(
         if template_crs:
             template_crs = CRS.from_string(template_crs)
         elif is_geographic(template_ds, template_varname):
-            template_crs = CRS({'init': 'EPSG:4326'})
+            template_crs = CRS.from_epsg(4326)
         else:
             raise click.UsageError('template dataset must have a valid projection defined')
 
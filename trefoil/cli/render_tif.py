@@ -26,7 +26,7 @@ from trefoil.render.renderers.stretched import StretchedRenderer
 from trefoil.render.renderers.unique import UniqueValuesRenderer
 from trefoil.render.renderers.utilities import renderer_from_dict
 from trefoil.netcdf.utilities import collect_statistics
-from trefoil.geometry.bbox import BBox
+from trefoil.geometry.bbox import BBox, get_geographic_projection
 from trefoil.cli import cli
 
 
@@ -284,13 +284,13 @@ def render_tif(
                     full_bbox = BBox((dst_affine.c, dst_affine.f + dst_affine.e * dst_shape[0],
                                      dst_affine.c + dst_affine.a * dst_shape[1], dst_affine.f),
                                      projection=Proj(dst_crs))
-                    wgs84_bbox = full_bbox.project(Proj(init='EPSG:4326'))
+                    wgs84_bbox = full_bbox.project(get_geographic_projection())
                     print('WGS84 Anchors: {0}'.format([[wgs84_bbox.ymin, wgs84_bbox.xmin], [wgs84_bbox.ymax, wgs84_bbox.xmax]]))
 
             elif anchors:
                 # Reproject the bbox of the output to WGS84
                     full_bbox = BBox(ds.bounds, projection=Proj(ds.crs))
-                    wgs84_bbox = full_bbox.project(Proj(init='EPSG:4326'))
+                    wgs84_bbox = full_bbox.project(get_geographic_projection())
                     print('WGS84 Anchors: {0}'.format([[wgs84_bbox.ymin, wgs84_bbox.xmin], [wgs84_bbox.ymax, wgs84_bbox.xmax]]))
 
             image_filename = os.path.join(output_directory,
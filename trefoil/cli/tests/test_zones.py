@@ -0,0 +1,19 @@
+import numpy
+from netCDF4 import Dataset
+
+from trefoil.cli.zones import get_raw_fill_value
+
+
+def test_get_raw_fill_value(tmpdir):
+    with Dataset(str(tmpdir.join('test.nc')), 'w') as ds:
+        ds.createDimension('x', 4)
+        ds.createVariable('uint8', 'uint8', ('x', ))[:] = numpy.array([0, 1, 254, 255], dtype='uint8')
+        ds.createVariable('uint8_fill', 'uint8', ('x', ), fill_value=255)
+        ds.createVariable('int16', 'int16', ('x', ))
+
+    with Dataset(str(tmpdir.join('test.nc'))) as ds:
+        # Whether default fill values of byte types are masked is left to netCDF4
+        assert get_raw_fill_value(ds.variables['uint8']) is None
+
+        assert get_raw_fill_value(ds.variables['uint8_fill']) == 255
+        assert get_raw_fill_value(ds.variables['int16']) == -32767
@@ -4,9 +4,9 @@ import click
 import os
 import numpy
 from PIL.Image import ANTIALIAS
-from pyproj import Proj
 from netCDF4 import Dataset
 
+from trefoil.geometry.bbox import get_geographic_projection
 from trefoil.utilities.color import Color
 from trefoil.netcdf.utilities import collect_statistics, resolve_dataset_variable
 from trefoil.render.renderers.stretched import StretchedRenderer
@@ -112,7 +112,7 @@ def get_leaflet_anchors(bbox):
     Returns Leaflet anchor coordinates for creating an ImageOverlay layer.
     """
 
-    wgs84_bbox = bbox.project(Proj(init='EPSG:4326'))
+    wgs84_bbox = bbox.project(get_geographic_projection())
     return [[wgs84_bbox.ymin, wgs84_bbox.xmin], [wgs84_bbox.ymax, wgs84_bbox.xmax]]
 
 def get_mask(mask_path):
@@ -1,16 +1,61 @@
 import os
 import glob
+from concurrent.futures import ProcessPoolExecutor
 from netCDF4 import Dataset
 
 import click
 from rasterio.enums import Resampling
 
 from trefoil.cli import cli
-from trefoil.netcdf.warp import warp_like
+from trefoil.netcdf.warp import warp_like, extract_template_grid
 from trefoil.netcdf.crs import get_crs
 from trefoil.netcdf.utilities import data_variables
 
 
+# Template dataset opened once by each worker process
+_worker_template_ds = None
+
+
+def _init_worker(like):
+    global _worker_template_ds
+    _worker_template_ds = Dataset(like)
+
+
+def _warp_file_in_worker(filename, *args):
+    _warp_file(filename, _worker_template_ds, *args)
+
+
+def _warp_file(filename, template_ds, output_directory, variables, src_crs, template_varname, template_grid,
+               resampling, num_threads):
+    """
+    Warp a single file into output_directory, using an already opened template dataset.
+    """
+
+    with Dataset(filename) as ds:
+        if not variables:
+            ds_variables = list(data_variables(ds).keys())
+        else:
+            # filter to only variables present in this dataset
+            ds_variables = [v for v in variables if v in ds.variables]
+
+        ds_crs = get_crs(ds, ds_variables[0]) or src_crs
+
+        with Dataset(os.path.join(output_directory, os.path.split(filename)[1]), 'w') as out_ds:
+            click.echo('Processing: {0}'.format(filename))
+
+            warp_like(
+                ds,
+                ds_projection=ds_crs,
+                variables=ds_variables,
+                out_ds=out_ds,
+                template_ds=template_ds,
+                template_varname=template_varname,
+                resampling=getattr(Resampling, resampling),
+                template_grid=template_grid,
+                num_threads=num_threads
+            )
+
+
 @cli.command(short_help="Warp NetCDF files to match a template")
 @click.argument('filename_pattern')
 @click.argument('output_directory', type=click.Path())
@@ -21,13 +66,16 @@ from trefoil.netcdf.utilities import data_variables
 @click.option('--resampling', default='nearest',
               type=click.Choice(('nearest', 'cubic', 'lanczos', 'mode')),
               help='Resampling method for reprojection', show_default=True)
+@click.option('--workers', type=click.IntRange(1), default=1,
+              help='Number of files to warp in parallel (separate processes)', show_default=True)
 def warp(
     filename_pattern,
     output_directory,
     variables,
     src_crs,
     like,
-    resampling):
+    resampling,
+    workers):
 
     if variables:
         variables = variables.strip().split(',')
@@ -39,29 +87,26 @@ def warp(
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
 
+    workers = min(workers, len(filenames))
+    # Split available CPUs between worker processes to avoid oversubscription
+    num_threads = max((os.cpu_count() or 1) // workers, 1)
+
     # For now, template dataset is required
-    template_ds = Dataset(like)
-    template_varname = data_variables(template_ds).keys()[0]
-
-    for filename in filenames:
-        with Dataset(filename) as ds:
-            if not variables:
-                ds_variables = data_variables(ds).keys()
-            else:
-                # filter to only variables present in this dataset
-                ds_variables = [v for v in variables if v in ds.variables]
-
-            ds_crs = get_crs(ds, ds_variables[0]) or src_crs
-
-            with Dataset(os.path.join(output_directory, os.path.split(filename)[1]), 'w') as out_ds:
-                click.echo('Processing: {0}'.format(filename))
-
-                warp_like(
-                    ds,
-                    ds_projection=ds_crs,
-                    variables=ds_variables,
-                    out_ds=out_ds,
-                    template_ds=template_ds,
-                    template_varname=template_varname,
-                    resampling=getattr(Resampling, resampling)
-                )
+    with Dataset(like) as template_ds:
+        template_varname = list(data_variables(template_ds).keys())[0]
+        # Read template grid once, instead of once per file
+        template_grid = extract_template_grid(template_ds, template_varname)
+
+        args = (output_directory, variables, src_crs, template_varname, template_grid, resampling, num_threads)
+
+        if workers == 1:
+            for filename in filenames:
+                _warp_file(filename, template_ds, *args)
+
+    if workers > 1:
+        # Each worker process opens the template once, and reuses it for all files it warps
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(like, )) as executor:
+            futures = [executor.submit(_warp_file_in_worker, filename, *args) for filename in filenames]
+            for future in futures:
+                # Re-raise any errors from worker processes
+                future.result()
@@ -3,6 +3,7 @@ import glob
 import os
 import time
 import json
+import math
 
 import click
 from pyproj import Proj
@@ -16,10 +17,144 @@ from rasterio.warp import transform_geom
 from rasterio.rio.options import file_in_arg, file_out_arg
 
 from trefoil.cli import cli
-from trefoil.analysis.summary import VALID_ZONAL_STATISTICS, calculate_zonal_statistics
+from trefoil.geometry.bbox import get_transformer
+from trefoil.analysis.summary import VALID_ZONAL_STATISTICS, ZonalStatisticsAccumulator
 from trefoil.netcdf.variable import SpatialCoordinateVariables
 from trefoil.netcdf.crs import get_crs, is_geographic
-from trefoil.netcdf.utilities import data_variables, get_fill_value
+from trefoil.netcdf.utilities import data_variables, get_chunk_shape, get_fill_value, get_fill_value_for_variable
+from trefoil.utilities.window import Window
+
+
+# Minimum size of tiles read at a time when calculating zonal statistics
+TILE_SIZE = 512
+
+# Maximum size (in bytes) of a variable that is read into memory all at once when calculating zonal statistics
+MAX_READ_SIZE = 256 * 1024 * 1024
+
+
+def get_tiles(variable, tile_size=TILE_SIZE):
+    """
+    Return windows that cover the last 2 dimensions of variable.  Tiles are aligned to whole chunks of the
+    variable if it is chunked, so that each chunk is only read once.
+
+    :param variable: netCDF variable
+    :param tile_size: minimum height and width of tiles
+    :return: list of Window instances
+    """
+
+    height, width = variable.shape[-2:]
+
+    chunking = variable.chunking()
+    if chunking in (None, 'contiguous'):
+        tile_height = tile_width = tile_size
+    else:
+        chunk_height, chunk_width = chunking[-2:]
+        tile_height = chunk_height * int(math.ceil(float(tile_size) / chunk_height))
+        tile_width = chunk_width * int(math.ceil(float(tile_size) / chunk_width))
+
+    return [
+        Window((y, min(y + tile_height, height)), (x, min(x + tile_width, width)))
+        for y in range(0, height, tile_height) for x in range(0, width, tile_width)
+    ]
+
+
+def get_coordinate_sequences(geometry):
+    """
+    Return the coordinate sequences (lists of points) of a GeoJSON geometry, in order.
+
+    :param geometry: GeoJSON geometry (Point, LineString, Polygon, or Multi* equivalents)
+    :return: list of coordinate sequences or None if geometry type is not supported
+    """
+
+    geometry_type = geometry['type']
+    coordinates = geometry['coordinates']
+
+    if geometry_type == 'Point':
+        return [[coordinates]]
+    elif geometry_type in ('LineString', 'MultiPoint'):
+        return [coordinates]
+    elif geometry_type in ('Polygon', 'MultiLineString'):
+        return list(coordinates)
+    elif geometry_type == 'MultiPolygon':
+        return [ring for polygon in coordinates for ring in polygon]
+
+    return None
+
+
+def get_geometry_bounds(geometry):
+    """
+    Return the bounds of a GeoJSON geometry.
+
+    :param geometry: GeoJSON geometry (Point, LineString, Polygon, or Multi* equivalents)
+    :return: (xmin, ymin, xmax, ymax) or None if geometry type is not supported
+    """
+
+    sequences = get_coordinate_sequences(geometry)
+    if not sequences:
+        return None
+
+    points = numpy.concatenate([numpy.asarray(sequence, dtype='float64') for sequence in sequences])
+    if not points.size:
+        return None
+
+    xmin, ymin = points[:, :2].min(axis=0)
+    xmax, ymax = points[:, :2].max(axis=0)
+    return xmin, ymin, xmax, ymax
+
+
+def transform_geometry(geometry, transformer):
+    """
+    Transform a GeoJSON geometry using a pyproj Transformer (in x, y order).  All coordinates of the geometry are
+    transformed in a single call.
+
+    :param geometry: GeoJSON geometry (Point, LineString, Polygon, or Multi* equivalents)
+    :param transformer: pyproj Transformer
+    :return: new GeoJSON geometry
+    """
+
+    geometry_type = geometry['type']
+    sequences = get_coordinate_sequences(geometry)
+    if sequences is None:
+        raise ValueError('Geometry type not supported: {0}'.format(geometry_type))
+
+    points = numpy.concatenate([numpy.asarray(sequence, dtype='float64')[:, :2] for sequence in sequences])
+    x, y = transformer.transform(points[:, 0], points[:, 1])
+    points = numpy.column_stack((x, y)).tolist()
+
+    # Split transformed points back into their original sequences
+    transformed = []
+    offset = 0
+    for sequence in sequences:
+        transformed.append(points[offset:offset + len(sequence)])
+        offset += len(sequence)
+
+    if geometry_type == 'Point':
+        coordinates = transformed[0][0]
+    elif geometry_type in ('LineString', 'MultiPoint'):
+        coordinates = transformed[0]
+    elif geometry_type in ('Polygon', 'MultiLineString'):
+        coordinates = transformed
+    else:
+        coordinates = []
+        for polygon in geometry['coordinates']:
+            coordinates.append(transformed[:len(polygon)])
+            transformed = transformed[len(polygon):]
+
+    return {'type': geometry_type, 'coordinates': coordinates}
+
+
+def intersects_bbox(geometry, bbox):
+    """
+    Returns True if bounds of the GeoJSON geometry intersect the BBox.  Geometries with bounds that cannot be
+    determined are assumed to intersect.
+    """
+
+    bounds = get_geometry_bounds(geometry)
+    if bounds is None:
+        return True
+
+    xmin, ymin, xmax, ymax = bounds
+    return xmin <= bbox.xmax and xmax >= bbox.xmin and ymin <= bbox.ymax and ymax >= bbox.ymin
 
 
 @cli.command(short_help='Create zones in a NetCDF from features in a shapefile')
@@ -29,7 +164,8 @@ from trefoil.netcdf.utilities import data_variables, get_fill_value
 @click.option('--attribute', type=click.STRING, default=None, help='Name of attribute in shapefile to use for zones (default: feature ID)')
 @click.option('--like', help='Template NetCDF dataset', type=click.Path(exists=True), required=True)
 @click.option('--netcdf3', is_flag=True, default=False, help='Output in NetCDF3 version instead of NetCDF4')
-@click.option('--zip', is_flag=True, default=False, help='Use zlib compression of data and coordinate variables')
+@click.option('--zip/--no-zip', default=True, show_default=True,
+              help='Use zlib compression of zones and values variables (NetCDF4 only)')
 def zones(
     input,
     output,
@@ -66,19 +202,22 @@ def zones(
         if template_crs:
             template_crs = CRS.from_string(template_crs)
         elif is_geographic(template_ds, template_varname):
-            template_crs = CRS({'init': 'EPSG:4326'})
+            template_crs = CRS.from_epsg(4326)
         else:
             raise click.UsageError('template dataset must have a valid projection defined')
 
         spatial_dimensions = template_variable.dimensions[-2:]
         out_shape = template_variable.shape[-2:]
 
+        # Parse the template CRS once; WKT is used for all conversions since it round-trips without loss
+        template_wkt = template_crs.to_wkt()
+
         template_y_name, template_x_name = spatial_dimensions
         coords = SpatialCoordinateVariables.from_dataset(
             template_ds,
             x_name=template_x_name,
             y_name=template_y_name,
-            projection=Proj(**template_crs.to_dict())
+            projection=Proj(template_wkt)
         )
 
 
@@ -93,47 +232,72 @@ def zones(
                 raise click.BadParameter('integer or string attribute required'.format(attribute),
                                          param='--attribute', param_hint='--attribute')
 
-        transform_required = CRS(shp.crs) != template_crs
+        shp_crs = CRS(shp.crs)
+        shp_wkt = shp_crs.to_wkt()
+        transform_required = shp_crs != template_crs
+        if transform_required and not template_crs.is_geographic:
+            # Transformer is created once for all features.  transform_geom is still used for geographic targets,
+            # since it cuts geometries along the antimeridian.
+            transformer = get_transformer(shp_wkt, template_wkt)
+        else:
+            transformer = None
         geometries = []
-        values = set()
-        values_lookup = {}
+        num_features = 0
+        values_lookup = []  # zone index to value; zone indices are dense from 0
+        value_indices = {}  # value to zone index
 
         # Project bbox for filtering
-        bbox = coords.bbox
+        template_bbox = coords.bbox
+        bbox = template_bbox
         if transform_required:
-            bbox = bbox.project(Proj(**shp.crs), edge_points=21)
+            bbox = bbox.project(Proj(shp_wkt), edge_points=21)
 
-        index = 0
         for f in shp.filter(bbox=bbox.as_list()):
             value = f['properties'].get(attribute) if attribute else int(f['id'])
             if value is not None:
                 geom = f['geometry']
-                if transform_required:
-                    geom = transform_geom(shp.crs, template_crs, geom)
+                if transformer is not None:
+                    geom = transform_geometry(geom, transformer)
+                elif transform_required:
+                    geom = transform_geom(shp_crs, template_crs, geom)
+
+                if geom['type'] == 'MultiPolygon':
+                    # Rasterize each part separately, so that GDAL only visits pixels within the bounds of each part
+                    parts = [{'type': 'Polygon', 'coordinates': part} for part in geom['coordinates']]
+                else:
+                    parts = [geom]
+
+                # Projected bbox used for filtering above may be larger than the template; skip parts outside it
+                parts = [part for part in parts if intersects_bbox(part, template_bbox)]
+                if not parts:
+                    continue
 
-                geometries.append((geom, index))
+                index = value_indices.get(value)
+                if index is None:
+                    index = len(values_lookup)
+                    value_indices[value] = index
+                    values_lookup.append(value)
 
-                if not value in values:
-                    values.add(value)
-                    values_lookup[index] = value
-                    index += 1
+                geometries.extend((part, index) for part in parts)
+                num_features += 1
 
             # Otherwise, these will not be rasterized
 
-        num_geometries = len(geometries)
         # Save a slot at the end for nodata
-        if num_geometries < 255:
+        if num_features < 255:
             dtype = numpy.dtype('uint8')
-        elif num_geometries < 65535:
+        elif num_features < 65535:
             dtype = numpy.dtype('uint16')
         else:
-            raise click.UsageError('Too many features to rasterize: {0}, Exceptioning...'.format(num_geometries))
+            raise click.UsageError('Too many features to rasterize: {0}, Exceptioning...'.format(num_features))
 
         fill_value = get_fill_value(dtype)
 
-        click.echo('Rasterizing {0} features into zones'.format(num_geometries))
+        click.echo('Rasterizing {0} features into zones'.format(num_features))
 
-    with rasterio.Env():
+    # Make sure GDAL's block cache can hold the output, otherwise rasterize falls back to a much slower approach
+    out_size_mb = out_shape[0] * out_shape[1] * dtype.itemsize // (1024 * 1024)
+    with rasterio.Env(GDAL_CACHEMAX=max(512, out_size_mb * 2)):
         zones = rasterize(
             geometries,
             out_shape=out_shape,
@@ -159,24 +323,82 @@ def zones(
     with Dataset(output, 'w', format=format) as out:
         values_varname = '{0}_values'.format(variable)
         coords.add_to_dataset(out, template_x_name, template_y_name)
+        compression_kwargs = {}
+        if zip and not netcdf3:
+            compression_kwargs = {'zlib': True, 'complevel': 4, 'shuffle': True}
+
+        var_kwargs = dict(compression_kwargs)
+        if not netcdf3:
+            # Chunk into tiles, so that zonal statistics can read zones tile by tile
+            var_kwargs['chunksizes'] = get_chunk_shape(out_shape)
+
         out_var = out.createVariable(variable, out_dtype,
                                      dimensions=spatial_dimensions,
-                                     zlib=zip,
-                                     fill_value=get_fill_value(out_dtype))
+                                     fill_value=get_fill_value(out_dtype),
+                                     **var_kwargs)
         out_var.setncattr('values', values_varname)
         out_var[:] = zones
 
-        out_values = numpy.array([values_lookup[k] for k in range(0, len(values_lookup))])
+        if attribute and att_dtype == 'str':
+            out_values = numpy.array(values_lookup)
+        else:
+            out_values = numpy.fromiter(values_lookup, dtype=numpy.int64, count=len(values_lookup))
         if netcdf3 and out_values.dtype == numpy.int64:
             out_values = out_values.astype('int32')
 
         out.createDimension(values_varname, len(out_values))
         values_var = out.createVariable(values_varname, out_values.dtype,
                                         dimensions=(values_varname, ),
-                                        zlib=zip)
+                                        **compression_kwargs)
         values_var[:] = out_values
 
 
+def get_raw_fill_value(variable):
+    """
+    Return the single value that marks missing data in variable, if masking can be done by comparing raw values
+    against it.  Returns None if netCDF4 needs to do the masking, because the variable is packed or has a valid range
+    or multiple missing values.
+    """
+
+    attributes = variable.ncattrs()
+    if set(attributes).intersection(('scale_factor', 'add_offset', 'valid_range', 'valid_min', 'valid_max')):
+        return None
+
+    if '_FillValue' in attributes and 'missing_value' in attributes:
+        return None
+
+    # netCDF4 does not always mask the default fill value for byte types (e.g., if filling is off), so leave it to netCDF4
+    if variable.dtype.itemsize == 1 and not set(attributes).intersection(('_FillValue', 'missing_value')):
+        return None
+
+    fill_value = numpy.asarray(get_fill_value_for_variable(variable))
+    if fill_value.size != 1:
+        return None
+
+    return fill_value.item()
+
+
+def iter_result_rows(results, statistics, has_z=False):
+    """
+    Yield rows of zonal statistics results for output to CSV, without building them all in memory first.
+
+    :param results: {filename: {variable: {zone: {statistic: value}}}}, with an extra level for z values
+    (before zone) if has_z is True
+    :param statistics: list of statistics, in output order
+    :param has_z: True if results include z values
+    """
+
+    for filename, filename_results in results.items():
+        for variable, variable_results in filename_results.items():
+            if has_z:
+                for z_value, z_results in variable_results.items():
+                    for zone, result in z_results.items():
+                        yield [filename, variable, z_value, zone] + [result[stat] for stat in statistics]
+            else:
+                for zone, result in variable_results.items():
+                    yield [filename, variable, zone] + [result[stat] for stat in statistics]
+
+
 @cli.command(short_help='Calculate zonal statistics for a series of NetCDF files')
 @click.argument('zones', type=click.Path(exists=True))
 @click.argument('filename_pattern')
@@ -241,6 +463,12 @@ def zonal_stats(
         zones = zones_ds.variables[zone_variable][:]
         zone_values = zones_ds.variables[values_variable][:]
 
+    # Use a plain array of the smallest unsigned type for zones.  Pixels outside all zones are set to an index past
+    # the last zone, which is ignored when tallying statistics.
+    num_zones = len(zone_values)
+    zones_dtype = numpy.min_scalar_type(num_zones)
+    zones = numpy.ma.filled(zones, num_zones).astype(zones_dtype)
+
     with Dataset(filenames[0]) as ds:
         if variables is not None:
             if set(variables).difference(ds.variables.keys()):
@@ -265,6 +493,17 @@ def zonal_stats(
         elif num_dimensions == 3:
             z_values = ds.variables[dimensions[0]][:]
 
+        tiles = get_tiles(var_obj)
+
+    # Zones are only read once per tile, and reused across all files, variables, and time steps
+    zone_tiles = []
+    for window in tiles:
+        zone_tile = numpy.ascontiguousarray(zones[window.y_slice, window.x_slice])
+        if (zone_tile < num_zones).any():  # skip tiles that are outside all zones
+            zone_tiles.append((window, zone_tile))
+
+    num_layers = shape[0] if num_dimensions == 3 else 1
+
     results = {}
     for filename in filenames:
         with Dataset(filename) as ds:
@@ -286,27 +525,42 @@ def zonal_stats(
                     raise click.UsageError(
                         'All datasets must have the same dimensions for {0}'.format(variable))
 
-                if num_dimensions == 3:
-                    results[filename_root][variable] = dict()
+                # Compare directly against the fill value instead of having netCDF4 build masked arrays, if possible
+                fill_value = get_raw_fill_value(var_obj)
+                if fill_value is not None:
+                    var_obj.set_auto_mask(False)
 
-                    for z_idx in range(shape[0]):
-                        z_value = z_values[z_idx].item()  # TODO: actually need to resolve z_idx to a time value in time variable!
-                        data = numpy.ma.masked_array(var_obj[z_idx])
-                        results[filename_root][variable][z_value] = calculate_zonal_statistics(zones, zone_values, data, statistics)
+                # Read small variables in a single call, and slice tiles from memory
+                if var_obj.size * var_obj.dtype.itemsize <= MAX_READ_SIZE:
+                    source = var_obj[:]
+                else:
+                    source = var_obj
 
-                    # this way works too, but may run out of memory
-                    # output below would need to be updated to use this though
-                    # data = numpy.ma.masked_array(var_obj[:])
-                    # results[filename_root][variable] = calculate_zonal_statistics(zones, zone_values, data, statistics)
+                accumulator = ZonalStatisticsAccumulator(num_zones, num_layers)
+                for window, zone_tile in zone_tiles:
+                    if num_dimensions == 3:
+                        data = source[:, window.y_slice, window.x_slice]
+                    else:
+                        data = source[window.y_slice, window.x_slice]
+
+                    accumulator.update(zone_tile, data, fill_value=fill_value)
+
+                variable_results = accumulator.get_results(zone_values, statistics)
+
+                if num_dimensions == 3:
+                    # TODO: actually need to resolve z_idx to a time value in time variable!
+                    results[filename_root][variable] = {
+                        z_values[z_idx].item(): variable_results[z_idx] for z_idx in range(shape[0])
+                    }
 
                 else:
-                    data = numpy.ma.masked_array(var_obj[:])
-                    results[filename_root][variable] = calculate_zonal_statistics(zones, zone_values, data, statistics)
+                    results[filename_root][variable] = variable_results[0]
 
-    with open(output, 'wb') as outfile:
-        if os.path.splitext(output)[1] == '.json':
-            outfile.write(json.dumps(results, indent=2))
-        else:
+    if os.path.splitext(output)[1] == '.json':
+        with open(output, 'w') as outfile:
+            json.dump(results, outfile, indent=2)
+    else:
+        with open(output, 'w', newline='') as outfile:
             writer = csv.writer(outfile)
             header = ['filename', 'variable']
             if num_dimensions == 3:
@@ -314,21 +568,6 @@ def zonal_stats(
             header += ['zone'] + statistics
             writer.writerow(header)
 
-            rows = []
-
-            for filename in results:
-                for variable in results[filename]:
-                    if num_dimensions == 3:
-                        for z_value in results[filename][variable]:
-                            for zone in results[filename][variable][z_value]:
-                                result = results[filename][variable][z_value][zone]
-                                rows.append([filename, variable, z_value, zone] + [result[stat] for stat in statistics])
-                    else:
-                        for zone in results[filename][variable]:
-                            result = results[filename][variable][zone]
-                            rows.append([filename, variable, zone] + [result[stat] for stat in statistics])
-
-            for row in rows:
-                writer.writerow(row)
+            writer.writerows(iter_result_rows(results, statistics, has_z=num_dimensions == 3))
 
     click.echo('Elapsed: {0:.2f}'.format(time.time() - start))
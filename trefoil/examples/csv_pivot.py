@@ -6,21 +6,20 @@ import time
 import pandas
 
 
-# Return a pipe-delimited combination of value from every column up through zone
-def get_key(row):
-    key_parts = []
-    for col in row.keys():
-        if col == 'zone':
-            return '|'.join(key_parts)
+# Return a pipe-delimited combination of values from every column up through zone, for all rows at once
+def get_key(df):
+    key_columns = df.columns[:df.columns.get_loc('zone')]
+    if not len(key_columns):
+        return pandas.Series('', index=df.index)
 
-        key_parts.append(str(row[col]))
+    return df[key_columns[0]].astype(str).str.cat([df[col].astype(str) for col in key_columns[1:]], sep='|')
 
 
 start = time.time()
 
 infilename = '/tmp/test.csv'
 df = pandas.read_csv(infilename)
-df['key'] = df.apply(lambda x: get_key(x), axis=1)
+df['key'] = get_key(df)
 sub_df = df[['key', 'zone', 'mean']]
 pivot = sub_df.pivot('zone', columns='key')
 
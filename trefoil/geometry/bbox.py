@@ -1,37 +1,53 @@
-import copy, math
-from itertools import product
-from pyproj import Proj, transform
+import math
+from functools import lru_cache
+import numpy
+from pyproj import Proj, Transformer
 from six import text_type
 
 from trefoil.utilities.proj import is_latlong
 
 
+@lru_cache(maxsize=128)
+def get_transformer(src_srs, dst_srs):
+    """
+    Return a Transformer between two projections (as PROJ4 or WKT strings), in x, y order.
+    Transformers are cached, since creating them is far more expensive than transforming a few points.
+    """
+
+    return Transformer.from_crs(src_srs, dst_srs, always_xy=True)
+
+
+@lru_cache(maxsize=1)
+def get_geographic_projection():
+    return Proj("EPSG:4326")
+
+
 class BBox(object):
     """
     Encapsulates bounding box related logic with associated projection information (must be a pyproj projection object).
     """
 
     def __init__(self, bbox, projection=None):
-        self.xmin = None
-        self.ymin = None
-        self.xmax = None
-        self.ymin = None
-        self.projection = None
-
         if isinstance(bbox, BBox):
-            for att in ("xmin", "ymin", "xmax", "ymax", "projection"):
-                setattr(self, att, getattr(bbox, att))
+            self.xmin, self.ymin, self.xmax, self.ymax = bbox.xmin, bbox.ymin, bbox.xmax, bbox.ymax
+            self.projection = bbox.projection
         elif isinstance(bbox, (list, tuple)) and len(bbox) == 4:
-            self.xmin = bbox[0]
-            self.ymin = bbox[1]
-            self.xmax = bbox[2]
-            self.ymax = bbox[3]
+            self.xmin, self.ymin, self.xmax, self.ymax = bbox
+            self.projection = None
+        else:
+            raise ValueError('bbox must be a BBox instance or a list or tuple of (xmin, ymin, xmax, ymax)')
+
         if projection:
             assert isinstance(projection, Proj)
             self.projection = projection
 
-        self.width = abs(self.xmax - self.xmin)
-        self.height = abs(self.ymax - self.ymin)
+    @property
+    def width(self):
+        return abs(self.xmax - self.xmin)
+
+    @property
+    def height(self):
+        return abs(self.ymax - self.ymin)
 
     def __unicode__(self):
         return text_type(self.as_list())
@@ -50,7 +66,7 @@ class BBox(object):
         )
 
     def clone(self):
-        return copy.copy(self)
+        return self.__class__(self)
 
     def as_list(self):
         return [getattr(self, key) for key in ("xmin", "ymin", "xmax", "ymax")]
@@ -79,22 +95,29 @@ class BBox(object):
         if target_projection.srs == self.projection.srs:
             return self.clone()
 
+        transformer = get_transformer(self.projection.srs, target_projection.srs)
+
         if edge_points < 2:
             # use corners only
-            x_values, y_values = transform(self.projection, target_projection, [self.xmin, self.xmax], [self.ymin, self.ymax])
+            x_values, y_values = transformer.transform([self.xmin, self.xmax], [self.ymin, self.ymax])
             return BBox((x_values[0], y_values[0], x_values[1], y_values[1]), projection=target_projection)
 
-        samples = range(0, edge_points)
-        xstep = float(self.xmax-self.xmin)/(edge_points-1)
-        ystep = float(self.ymax-self.ymin)/(edge_points-1)
-        x_values = []
-        y_values = []
-        for i, j in product(samples, samples):
-            x_values.append(self.xmin + xstep * i)
-            y_values.append(self.ymin + ystep * j)
+        # Only the perimeter is sampled; the outer bounds of the projected coords are always along the edges
+        x_samples = numpy.linspace(self.xmin, self.xmax, edge_points)
+        y_samples = numpy.linspace(self.ymin, self.ymax, edge_points)
+        x_values = numpy.concatenate((
+            x_samples, x_samples, numpy.full(edge_points, self.xmin), numpy.full(edge_points, self.xmax)
+        ))
+        y_values = numpy.concatenate((
+            numpy.full(edge_points, self.ymin), numpy.full(edge_points, self.ymax), y_samples, y_samples
+        ))
+
         # TODO: check for bidrectional consistency, as is done in ncserve BoundingBox.project() method
-        x_values, y_values = transform(self.projection, target_projection, x_values, y_values)
-        return BBox((min(x_values), min(y_values), max(x_values), max(y_values)), target_projection)
+        x_values, y_values = transformer.transform(x_values, y_values)
+        return BBox(
+            (x_values.min().item(), y_values.min().item(), x_values.max().item(), y_values.max().item()),
+            target_projection
+        )
 
     def get_local_albers_projection(self):
         """
@@ -105,7 +128,7 @@ class BBox(object):
         """
 
         inset_factor = 1.0 / 6.0
-        geo_bbox = self.project(Proj(init="EPSG:4326"))
+        geo_bbox = self.project(get_geographic_projection())
         # Make sure we are within world domain
         assert geo_bbox.xmin >= -180 and geo_bbox.xmax <= 180 and geo_bbox.ymin >= -90 and geo_bbox.ymax <= 90
         inset = math.fabs((geo_bbox.ymax - geo_bbox.ymin) * inset_factor)
@@ -123,7 +146,12 @@ def union_bbox(bboxes):
     if not bboxes:
         return None
 
-    x_set = {b.xmin for b in bboxes} | {b.xmax for b in bboxes}
-    y_set = {b.ymin for b in bboxes} | {b.ymax for b in bboxes}
-
-    return BBox((min(x_set), min(y_set), max(x_set), max(y_set)), projection=bboxes[0].projection)
+    return BBox(
+        (
+            min(b.xmin for b in bboxes),
+            min(b.ymin for b in bboxes),
+            max(b.xmax for b in bboxes),
+            max(b.ymax for b in bboxes)
+        ),
+        projection=bboxes[0].projection
+    )
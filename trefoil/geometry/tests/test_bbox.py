@@ -1,6 +1,6 @@
 import numpy
 from pyproj import Proj
-from trefoil.geometry.bbox import BBox
+from trefoil.geometry.bbox import BBox, union_bbox
 from rasterio.crs import CRS
 
 
@@ -32,3 +32,15 @@ def test_projection():
         proj_bbox.as_list(),
         [-13887106.476460878, 6211469.632719522, -13845361.6674134, 6274861.394006577]
     )
+
+
+def test_bbox_from_bbox():
+    bbox = BBox(BBox(TEST_COORDS, TEST_COORDS_PRJ))
+    assert bbox.as_list() == list(TEST_COORDS)
+    assert bbox.projection.srs == TEST_COORDS_PRJ.srs
+
+
+def test_union_bbox():
+    bbox = union_bbox([BBox((0, 0, 10, 10)), None, BBox((-5, 5, 5, 20))])
+    assert bbox.as_list() == [-5, 0, 10, 20]
+    assert union_bbox([None]) is None
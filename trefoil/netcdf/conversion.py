@@ -3,6 +3,7 @@ import os
 import time
 
 import rasterio
+from rasterio.windows import Window
 import pyproj
 from six import string_types
 
@@ -10,10 +11,15 @@ from trefoil.netcdf.crs import set_crs
 from trefoil.netcdf.variable import SpatialCoordinateVariables
 from trefoil.geometry.bbox import BBox
 from trefoil.netcdf.crs import get_crs
+from trefoil.netcdf.utilities import get_chunk_shape
 from trefoil.utilities.conversion import array_to_raster
 from trefoil.utilities.proj import is_latlong
 
 
+# Number of rows copied at a time from rasters to unchunked NetCDF variables
+BLOCK_HEIGHT = 512
+
+
 def raster_to_netcdf(filename_or_raster, outfilename=None, variable_name='data', format='NETCDF4', **kwargs):
     """
     Parameters
@@ -22,7 +28,8 @@ def raster_to_netcdf(filename_or_raster, outfilename=None, variable_name='data',
     outfilename: name of output file.  If blank, will be same name as input with *.nc extension added
     variable_name: output format for netCDF file: NETCDF3_CLASSIC, NETCDF3_64BIT, NETCDF4_CLASSIC, NETCDF4
     format
-    kwargs: arguments passed to variable creation: zlib
+    kwargs: arguments passed to variable creation: zlib.  Data variable is chunked in tiles and compressed
+    (zlib=True, complevel=4, shuffle=True) for NETCDF4 formats, unless chunksizes or zlib are provided.
 
     Note: only rasters with descending y coordinates are currently supported
     """
@@ -53,14 +60,26 @@ def raster_to_netcdf(filename_or_raster, outfilename=None, variable_name='data',
             x_varname = 'x'
             y_varname = 'y'
 
-        # TODO: may need to do this in blocks if source is big
-        data = src.read(1, masked=True)
-
         coords = SpatialCoordinateVariables.from_bbox(BBox(src.bounds, prj), src.width, src.height)
         coords.add_to_dataset(target, x_varname, y_varname, **kwargs)
 
-        out_var = target.createVariable(variable_name, data.dtype, dimensions=(y_varname, x_varname), **kwargs)
-        out_var[:] = data
+        var_kwargs = dict(kwargs)
+        if format.startswith('NETCDF4'):
+            if 'chunksizes' not in var_kwargs:
+                var_kwargs['chunksizes'] = get_chunk_shape((src.height, src.width))
+            if 'zlib' not in var_kwargs:
+                var_kwargs.update(zlib=True, complevel=4, shuffle=True)
+
+        out_var = target.createVariable(
+            variable_name, src.dtypes[0], dimensions=(y_varname, x_varname), **var_kwargs
+        )
+
+        # Copy data in bands of rows (aligned to chunks, if any), to avoid reading the entire raster into memory
+        block_height = var_kwargs.get('chunksizes', (BLOCK_HEIGHT, ))[0]
+        for row in range(0, src.height, block_height):
+            window = Window(0, row, src.width, min(block_height, src.height - row))
+            out_var[row:row + window.height] = src.read(1, window=window, masked=True)
+
         set_crs(target, variable_name, prj, set_proj4_att=False)
 
     if managed_raster:
@@ -10,10 +10,11 @@ https://github.com/NCPP/ocgis/blob/master/src/ocgis/interface/base/crs.py
 import logging
 import os
 import re
-from pyproj import Proj, pj_list, pj_ellps
+import warnings
+from functools import lru_cache
+from pyproj import CRS, Proj, pj_list, pj_ellps
 
 from trefoil.netcdf.utilities import get_ncattrs, set_ncattrs
-from rasterio.crs import CRS
 
 # pyproj 2 drops `pyproj_datadir` in favor of `datadir.get_data_dir()`
 try:
@@ -25,6 +26,15 @@ except ImportError:
 
 PROJ4_GEOGRAPHIC = '+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs'
 
+EPSG_CODE_RE = re.compile(r'(?<=epsg:)\d+')
+
+# Sorted pairs of lowercase spatial dimension names that indicate geographic coordinates
+GEOGRAPHIC_DIMENSIONS = frozenset((
+    ('lat', 'lon'),
+    ('lat', 'long'),
+    ('latitude', 'longitude')
+))
+
 logger = logging.getLogger(__name__)
 
 
@@ -32,9 +42,17 @@ def invert_dict(dictionary):
     return {v: k for k, v in dictionary.items()}
 
 
+@lru_cache(maxsize=1)
+def read_epsg_file():
+    """ Return the contents of the pyproj epsg file, which is only read once """
+
+    with open(os.path.join(pyproj_datadir, 'epsg')) as f:
+        return f.read()
+
+
+@lru_cache(maxsize=None)
 def epsg_to_proj4(epsg_code):
-    data = open(os.path.join(pyproj_datadir, 'epsg')).read()
-    match = re.search('(?<=<{0}>).*(?=<>)'.format(epsg_code), data)
+    match = re.search('(?<=<{0}>).*(?=<>)'.format(epsg_code), read_epsg_file())
     if not match:
         raise ValueError('ERROR: EPSG {0} not found in proj4 data file'.format(epsg_code))
 
@@ -107,6 +125,23 @@ CF_PROJ4_ELLPSOID_MAP = invert_dict(PROJ4_CF_ELLIPSOID_MAP)
 CF_PROJ4_NAMES = invert_dict(PROJ4_CF_NAMES)
 CF_PROJ4_PARAM_MAP = {PROJ4_CF_NAMES[k]: invert_dict(PROJ4_CF_PARAM_MAP[k]) for k in PROJ4_CF_PARAM_MAP}
 
+# Precompute parameter mappings as tuples, so that conversions are a single pass over the parameters of a projection.
+# CF name: (expected CF params, ((CF param, PROJ4 param, has numbered PROJ4 params), ...))
+CF_PROJ4_PARAM_ITEMS = {
+    k: (frozenset(v), tuple((param, proj4_param, '{' in proj4_param) for param, proj4_param in v.items()))
+    for k, v in CF_PROJ4_PARAM_MAP.items()
+}
+# PROJ4 name: ((PROJ4 param, CF param, numbered PROJ4 params or None), ...)
+PROJ4_CF_PARAM_ITEMS = {
+    k: tuple(
+        (param, cf_param, tuple(param.format(i) for i in (1, 2)) if '{' in param else None)
+        for param, cf_param in v.items()
+    )
+    for k, v in PROJ4_CF_PARAM_MAP.items()
+}
+CF_PROJ4_ELLIPSOID_ITEMS = tuple(CF_PROJ4_ELLPSOID_MAP.items())
+PROJ4_CF_ELLIPSOID_ITEMS = tuple(PROJ4_CF_ELLIPSOID_MAP.items())
+
 
 def get_crs(dataset, variable_name):
     """
@@ -121,24 +156,24 @@ def get_crs(dataset, variable_name):
     :return: PROJ4 projection string or None
     """
 
-    ncatts = get_ncattrs(dataset.variables[variable_name])
-    dsatts = get_ncattrs(dataset)
+    variable = dataset.variables[variable_name]
 
-    # If dataset already includes proj4 string, just use it
-    existing_proj4 = dsatts.get(PROJ4_KEY) or ncatts.get(PROJ4_KEY)
+    # If dataset already includes proj4 string, just use it.  Only the attributes needed are read.
+    existing_proj4 = getattr(dataset, PROJ4_KEY, None) or getattr(variable, PROJ4_KEY, None)
     if existing_proj4:
         return existing_proj4
 
     # Attempt to construct proj4 string based on CF convention parameters
-    if 'grid_mapping' not in ncatts:
+    grid_mapping = getattr(variable, 'grid_mapping', None)
+    if grid_mapping is None:
         logger.debug('grid_mapping attribute not found for variable {0}'.format(variable_name))
         return None
 
-    if ncatts['grid_mapping'] not in dataset.variables:
-        logger.debug('grid_mapping variable {0} not found in dataset'.format(ncatts['grid_mapping']))
+    if grid_mapping not in dataset.variables:
+        logger.debug('grid_mapping variable {0} not found in dataset'.format(grid_mapping))
         return None
 
-    crs_variable = dataset.variables[ncatts['grid_mapping']]
+    crs_variable = dataset.variables[grid_mapping]
     crs_atts = get_ncattrs(crs_variable)
 
     cf_crs_name = crs_atts.get('grid_mapping_name')
@@ -147,30 +182,36 @@ def get_crs(dataset, variable_name):
         logger.debug('No supported projection found for {0}'.format(cf_crs_name))
         return None
 
-    param_map = CF_PROJ4_PARAM_MAP[cf_crs_name]
-
     proj4_params = {'proj': CF_PROJ4_NAMES[cf_crs_name]}
 
-    expected_params = set(CF_PROJ4_PARAM_MAP[cf_crs_name].keys())
-    if expected_params.difference(crs_atts):
+    expected_params, param_items = CF_PROJ4_PARAM_ITEMS[cf_crs_name]
+    if not expected_params.issubset(crs_atts):
         logger.debug('Missing expected parameters {0}'.format(expected_params.difference(crs_atts)))
 
-    for param in expected_params.intersection(crs_atts):
+    for param, proj4_param, is_numbered in param_items:
+        if param not in crs_atts:
+            continue
+
         value = crs_atts[param]
 
-        if param == 'standard_parallel' and '{' in param_map[param]:
+        if is_numbered:
             # Special case: variable number of standard parallels
-            value = list(value)
-            for index, val in enumerate(value, start=1):
-                proj4_params[param_map[param].format(index)] = val
+            for index, val in enumerate(list(value), start=1):
+                proj4_params[proj4_param.format(index)] = val
         else:
-            proj4_params[param_map[param]] = value
+            proj4_params[proj4_param] = value
 
-    for param in set(CF_PROJ4_ELLPSOID_MAP.keys()).intersection(crs_atts):
-        proj4_params[CF_PROJ4_ELLPSOID_MAP[param]] = crs_atts[param]
+    for param, proj4_param in CF_PROJ4_ELLIPSOID_ITEMS:
+        if param in crs_atts:
+            proj4_params[proj4_param] = crs_atts[param]
+
+    # Parameters are already valid PROJ4 parameters, so they are joined directly rather than round-tripped through CRS
+    proj4 = ' '.join(
+        '+{0}'.format(key) if value is True else '+{0}={1}'.format(key, value) for key, value in proj4_params.items()
+    )
 
     try:
-        return Proj(**CRS(proj4_params).to_dict()).srs
+        return Proj(proj4).srs
 
     except:
         # Could not create valid projection
@@ -196,7 +237,7 @@ def set_crs(dataset, variable_name, projection, set_proj4_att=False):
     variable = dataset.variables[variable_name]
 
     if 'epsg:' in projection.srs:
-        proj_string = epsg_to_proj4(re.search('(?<=epsg:)\d+', projection.srs).group())
+        proj_string = epsg_to_proj4(EPSG_CODE_RE.search(projection.srs).group())
     else:
         proj_string = projection.srs
 
@@ -204,7 +245,10 @@ def set_crs(dataset, variable_name, projection, set_proj4_att=False):
         variable.setncattr(PROJ4_KEY, proj_string)
 
     proj = CRS.from_string(proj_string)
-    proj_data = proj.to_dict()
+    with warnings.catch_warnings():
+        # CF parameters can only represent what is in the PROJ4 parameters, so loss of information is expected here
+        warnings.simplefilter('ignore', UserWarning)
+        proj_data = proj.to_dict()
     proj_key = 'latlong' if not proj.is_projected else proj_data['proj']
     if not proj_key in PROJ4_CF_PARAM_MAP.keys():
         raise ValueError('CF Convention mapping is not yet available for projection {0}'.format(proj_key))
@@ -215,19 +259,17 @@ def set_crs(dataset, variable_name, projection, set_proj4_att=False):
 
         ncatts = {'grid_mapping_name': PROJ4_CF_NAMES[proj_key]}
 
-        out_proj_params = PROJ4_CF_PARAM_MAP[proj_key]
-        for param in out_proj_params:
-            if param.count('{'):
+        for param, cf_param, numbered_params in PROJ4_CF_PARAM_ITEMS[proj_key]:
+            if numbered_params:
                 # Special case - standard parallel
-                keys = [param.format(i) for i in (1, 2)]
-                values = [proj_data[key] for key in keys if key in proj_data]
+                values = [proj_data[key] for key in numbered_params if key in proj_data]
                 if values:
                     if len(values) == 1:
                         values = values[0]
-                    ncatts[out_proj_params[param]] = values
+                    ncatts[cf_param] = values
 
             elif param in proj_data:
-                ncatts[out_proj_params[param]] = proj_data[param]
+                ncatts[cf_param] = proj_data[param]
 
         if 'datum' in proj_data and not 'ellps' in proj_data:
             # Not all datums link to available pj_ellps keys, some had to be added manually here
@@ -247,11 +289,13 @@ def set_crs(dataset, variable_name, projection, set_proj4_att=False):
                 raise ValueError('projection ellipsoid does not match a known ellipsoid')
 
             ellipsoid_params = pj_ellps[proj_data['ellps']]
-            for param in set(PROJ4_CF_ELLIPSOID_MAP.keys()).intersection(ellipsoid_params):
-                proj_data[param] = ellipsoid_params[param]
+            for param, _ in PROJ4_CF_ELLIPSOID_ITEMS:
+                if param in ellipsoid_params:
+                    proj_data[param] = ellipsoid_params[param]
 
-        for param in set(PROJ4_CF_ELLIPSOID_MAP.keys()).intersection(proj_data):
-            ncatts[PROJ4_CF_ELLIPSOID_MAP[param]] = proj_data[param]
+        for param, cf_param in PROJ4_CF_ELLIPSOID_ITEMS:
+            if param in proj_data:
+                ncatts[cf_param] = proj_data[param]
 
         set_ncattrs(crs_variable, ncatts)
 
@@ -269,19 +313,10 @@ def is_geographic(dataset, variable_name):
     :returns: True if variable appears to be in geographic coordinates
     """
 
-    options = (
-        {'lat', 'lon'},
-        {'lat', 'long'},
-        {'latitude', 'longitude'}
-    )
-
-    variable = dataset.variables[variable_name]
-    dim_names = set([d.lower() for d in variable.dimensions[-2:]])
-
-    for option in options:
-        if not option.difference(dim_names):
-            return True
+    dimensions = dataset.variables[variable_name].dimensions[-2:]
+    if len(dimensions) < 2:
+        return False
 
-    return False
+    return tuple(sorted(d.lower() for d in dimensions)) in GEOGRAPHIC_DIMENSIONS
 
 
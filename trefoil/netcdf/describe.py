@@ -1,9 +1,11 @@
+from functools import lru_cache
+
 import numpy
 from six import string_types
 from netCDF4 import Dataset
 from pyproj import Proj
 
-from trefoil.netcdf.crs import get_crs, is_geographic, PROJ4_GEOGRAPHIC
+from trefoil.netcdf.crs import get_crs, is_geographic, PROJ4_GEOGRAPHIC, PROJ4_KEY
 from trefoil.netcdf.utilities import get_ncattrs
 from trefoil.netcdf.variable import SpatialCoordinateVariable, SpatialCoordinateVariables, DateVariable
 
@@ -15,17 +17,77 @@ Y_DIMENSION_COMMON_NAMES = ('latitude', 'lat', 'y')
 TIME_DIMENSION_STANDARD_NAMES = ('time',)
 TIME_DIMENSION_COMMON_NAMES = ('time', 'year', 'years')  # TODO: months?
 
+# Maximum size (in bytes) of data read at a time when calculating min / max of variables with > 2 dimensions
+MAX_READ_SIZE = 64 * 1024 * 1024
+
+
+@lru_cache(maxsize=32)
+def get_projection(proj4):
+    """ Return a Proj object for a PROJ4 string.  These are cached, since few projections are used in practice. """
+
+    return Proj(str(proj4))
+
 
 def get_interval(data):
     if data.shape[0] > 1:
-        unique_intervals = numpy.unique(data[1:] - data[:-1])
-        if unique_intervals.shape[0] == 1:
-            return numpy.abs(unique_intervals[0]).item()
+        # Read data once, and compare intervals against the first rather than sorting them
+        values = data[:]
+        interval = values[1] - values[0]
+
+        # Most irregular coordinates (e.g., months) can be rejected without checking all intervals
+        if values[-1] - values[-2] == interval and (numpy.diff(values) == interval).all():
+            return numpy.abs(interval).item()
 
     # Not equal interval, interval doesn't apply
     return None
 
 
+def get_dimension_role(dimension_name, standard_name):
+    """
+    Return the role of a dimension based on its name or the standard name of its coordinate variable.
+
+    :return: 'x', 'y', 'time', or None
+    """
+
+    if standard_name in X_DIMENSION_STANDARD_NAMES or dimension_name in X_DIMENSION_COMMON_NAMES:
+        return 'x'
+    elif standard_name in Y_DIMENSION_STANDARD_NAMES or dimension_name in Y_DIMENSION_COMMON_NAMES:
+        return 'y'
+    elif standard_name in TIME_DIMENSION_STANDARD_NAMES or dimension_name in TIME_DIMENSION_COMMON_NAMES:
+        return 'time'
+
+    return None
+
+
+def get_min_max(variable):
+    """
+    Return the min and max values of a variable, reading it in blocks along the first index (usually time) to avoid
+    loading the entire array into memory.  Blocks are aligned to chunks of the variable, if it is chunked.
+
+    :param variable: netCDF variable
+    :return: (min, max) tuple, or (None, None) if all values are masked
+    """
+
+    step = max(MAX_READ_SIZE // (variable.dtype.itemsize * int(numpy.prod(variable.shape[1:]))), 1)
+    chunks = variable.chunking()
+    if chunks not in (None, 'contiguous'):  # None for NETCDF3 files
+        step = max(step // chunks[0], 1) * chunks[0]
+
+    min_value = None
+    max_value = None
+    for i in range(0, variable.shape[0], step):
+        block = numpy.ma.asarray(variable[i:i + step])
+        if not block.count():
+            continue
+
+        block_min = block.min().item()
+        block_max = block.max().item()
+        min_value = block_min if min_value is None else min(min_value, block_min)
+        max_value = block_max if max_value is None else max(max_value, block_max)
+
+    return min_value, max_value
+
+
 def describe(path_or_dataset):
     if isinstance(path_or_dataset, string_types):
         dataset = Dataset(path_or_dataset)
@@ -38,14 +100,24 @@ def describe(path_or_dataset):
         'attributes': get_ncattrs(dataset)
     }
 
-    for dimension_name in dataset.dimensions:
-        dimension = dataset.dimensions[dimension_name]
+    variables = dataset.variables
+    dimensions = dataset.dimensions
+
+    for dimension_name, dimension in dimensions.items():
         description['dimensions'][dimension_name] = {
             'length': len(dimension)
         }
 
-    for variable_name in dataset.variables:
-        variable = dataset.variables[variable_name]
+    # Dimensions with coordinate variables are classified once, rather than for every data variable that uses them
+    dimension_roles = {
+        name: get_dimension_role(name, getattr(variables[name], 'standard_name', None))
+        for name in dimensions if name in variables
+    }
+
+    # Data variables usually share the same grid_mapping variable, so each projection only needs to be extracted once
+    proj4_by_attributes = {}
+
+    for variable_name, variable in variables.items():
 
         if not variable.dimensions:
             # Do not collect info about dimensionless variables (e.g., CRS variable)
@@ -63,12 +135,13 @@ def describe(path_or_dataset):
             'name': attributes.get('long_name') or attributes.get('standard_name') or variable_name
         }
 
+        data = None
         if dtype not in ('str', ):
             if len(variable.shape) > 2:
-                # Avoid loading the entire array into memory by iterating along the first index (usually time)
+                min_value, max_value = get_min_max(variable)
                 variable_info.update({
-                    'min': min(variable[i, :].min().item() for i in range(variable.shape[0])),
-                    'max': max(variable[i, :].max().item() for i in range(variable.shape[0]))
+                    'min': min_value,
+                    'max': max_value
                 })
             else:
                 data = variable[:]
@@ -77,41 +150,42 @@ def describe(path_or_dataset):
                     'max': data.max().item()
                 })
 
-        if variable_name in dataset.dimensions and dtype not in ('str', ):
-            dimension_variable = dataset.variables[variable_name]
-            if len(dimension_variable.dimensions) == 1:  # range dimensions don't make sense for interval
-                interval = get_interval(dimension_variable)
+        if variable_name in dimensions and dtype not in ('str', ):
+            if len(variable.dimensions) == 1:  # range dimensions don't make sense for interval
+                # Data were already read above
+                interval = get_interval(data)
                 if interval:
                     variable_info['interval'] = interval
 
         else:
             # Data variable
-            proj4 = get_crs(dataset, variable_name)
+            crs_attributes = (getattr(variable, PROJ4_KEY, None), getattr(variable, 'grid_mapping', None))
+            if crs_attributes not in proj4_by_attributes:
+                proj4_by_attributes[crs_attributes] = get_crs(dataset, variable_name)
+            proj4 = proj4_by_attributes[crs_attributes]
 
             #extent
             if len(variable.dimensions) >= 2:
                 x_variable_name = None
                 y_variable_name = None
                 time_variable_name = None
-                for dimension_name in (x for x in variable.dimensions if x in dataset.variables):
-                    attributes = get_ncattrs(dataset.variables[dimension_name])
-                    standard_name = attributes.get('standard_name', None)
-                    if standard_name in X_DIMENSION_STANDARD_NAMES or dimension_name in X_DIMENSION_COMMON_NAMES:
+                for dimension_name in variable.dimensions:
+                    role = dimension_roles.get(dimension_name)
+                    if role == 'x':
                         x_variable_name = dimension_name
-                    elif standard_name in Y_DIMENSION_STANDARD_NAMES or dimension_name in Y_DIMENSION_COMMON_NAMES:
+                    elif role == 'y':
                         y_variable_name = dimension_name
-                    elif standard_name in TIME_DIMENSION_STANDARD_NAMES or dimension_name in TIME_DIMENSION_COMMON_NAMES:
-                        if len(dataset.dimensions[dimension_name]) > 1:
-                            time_variable_name = dimension_name
+                    elif role == 'time' and len(dimensions[dimension_name]) > 1:
+                        time_variable_name = dimension_name
                 if x_variable_name and y_variable_name:
                     if proj4 is None and is_geographic(dataset, variable_name):
                         # Assume WGS84
                         proj4 = PROJ4_GEOGRAPHIC
 
                     coordinates = SpatialCoordinateVariables(
-                        SpatialCoordinateVariable(dataset.variables[x_variable_name]),
-                        SpatialCoordinateVariable(dataset.variables[y_variable_name]),
-                        Proj(str(proj4)) if proj4 else None
+                        SpatialCoordinateVariable(variables[x_variable_name]),
+                        SpatialCoordinateVariable(variables[y_variable_name]),
+                        get_projection(proj4) if proj4 else None
                     )
 
                     variable_info['spatial_grid'] = {
@@ -122,7 +196,7 @@ def describe(path_or_dataset):
                         'y_resolution': coordinates.y.pixel_size
                     }
                 if time_variable_name:
-                    time_variable = dataset.variables[time_variable_name]
+                    time_variable = variables[time_variable_name]
 
                     time_info = {
                         'dimension': time_variable_name,
@@ -133,7 +207,7 @@ def describe(path_or_dataset):
                         values = date_variable.datetimes
                         time_info['extent'] = [values.min().isoformat(), values.max().isoformat()]
                         time_info['interval_unit'] = date_variable.unit
-                        interval = get_interval(time_variable)
+                        interval = get_interval(date_variable.values)
                         if interval is not None:
                             time_info['interval'] = interval
 
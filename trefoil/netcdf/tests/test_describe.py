@@ -0,0 +1,28 @@
+import numpy
+from netCDF4 import Dataset
+from pyproj import Proj
+
+from trefoil.geometry.bbox import BBox
+from trefoil.netcdf.describe import describe
+from trefoil.netcdf.variable import SpatialCoordinateVariables
+
+
+def test_describe_netcdf3(tmpdir):
+    # Variables in NETCDF3 files are not chunked; chunking() returns None for them
+    coords = SpatialCoordinateVariables.from_bbox(BBox((-120, 40, -115, 45), Proj('EPSG:4326')), 20, 10)
+    data = numpy.arange(600, dtype=numpy.float32).reshape(3, 10, 20)
+
+    with Dataset(str(tmpdir.join('test.nc')), 'w', format='NETCDF3_CLASSIC') as ds:
+        coords.add_to_dataset(ds, 'lon', 'lat')
+        ds.createDimension('band', 3)
+        variable = ds.createVariable('data', 'float32', ('band', 'lat', 'lon'), fill_value=-1)
+        variable[:] = data
+        variable[0, 0, 0] = numpy.ma.masked
+
+    with Dataset(str(tmpdir.join('test.nc'))) as ds:
+        description = describe(ds)
+
+    variable_info = description['variables']['data']
+    assert variable_info['min'] == 1
+    assert variable_info['max'] == 599
+    assert variable_info['spatial_grid']['x_dimension'] == 'lon'
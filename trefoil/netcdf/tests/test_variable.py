@@ -1,8 +1,10 @@
 import os
+from bisect import bisect_left
 import numpy
+import pytest
 from pyproj import Proj
 from netCDF4 import Dataset
-from trefoil.netcdf.variable import CoordinateVariable, BoundsCoordinateVariable
+from trefoil.netcdf.variable import CoordinateVariable, BoundsCoordinateVariable, bisect_near
 from trefoil.netcdf.variable import SpatialCoordinateVariable, SpatialCoordinateVariables
 from trefoil.geometry.bbox import BBox
 
@@ -46,6 +48,37 @@ def test_range_functions():
 
     assert variable.indices_for_range(40, 50) == (variable.values.size-1, variable.values.size-1)
     assert numpy.array_equal(variable.slice_by_range(40, 50), numpy.array([]))
+    assert variable.slice_by_range(40, 50).dtype == data.dtype
+
+
+def test_indices_for_ranges():
+    for data in (numpy.arange(20, 40), numpy.arange(40, 20, -1)):
+        variable = CoordinateVariable(data)
+        starts = numpy.array([2, 22, 25.5, 30, 45])
+        stops = numpy.array([10, 27, 35, 100, 50])
+        start_indices, stop_indices = variable.indices_for_ranges(starts, stops)
+        assert list(zip(start_indices, stop_indices)) == [
+            variable.indices_for_range(start, stop) for start, stop in zip(starts, stops)
+        ]
+
+
+def test_bisect_near():
+    values = [0, 1, 2, 2, 3, 5]
+    for value in (-1, 0, 1.5, 2, 4, 6):
+        for hint in range(-1, len(values) + 2):
+            assert bisect_near(values, value, hint) == bisect_left(values, value)
+
+
+def test_replace_values():
+    variable = CoordinateVariable(numpy.arange(10))
+    assert variable.is_ascending_order()
+    assert variable.indices_for_range(2, 5) == (2, 5)
+
+    # Order and range must be updated for new values
+    variable.values = numpy.arange(20, 0, -1)
+    assert not variable.is_ascending_order()
+    assert variable.indices_for_range(5, 8) == (12, 15)
+    assert variable.indices_for_range(30, 40) == (19, 19)
 
 
 def test_window_for_bbox():
@@ -56,6 +89,31 @@ def test_window_for_bbox():
     assert window.y_slice == slice(1, 19)
 
 
+def test_windows_for_bboxes():
+    coords = SpatialCoordinateVariables.from_bbox(BBox([-124, 82, -122, 90], Proj(init='epsg:4326')), 20, 20)
+    bboxes = [BBox([-123.9, 82.4, -122.1, 89.6]), BBox([-123, 84, -122.5, 86]), BBox([-130, 70, -125, 80])]
+    windows = coords.get_windows_for_bboxes(bboxes)
+
+    assert len(windows) == len(bboxes)
+    for bbox, window in zip(bboxes, windows):
+        expected = coords.get_window_for_bbox(bbox)
+        assert window.x_slice == expected.x_slice
+        assert window.y_slice == expected.y_slice
+
+
+def test_offsets_for_subsets():
+    # Regular and irregular intervals
+    for data in (numpy.arange(20, 0, -1) * 0.5, numpy.array([0, 1, 2.5, 3, 7, 7.5])):
+        variable = SpatialCoordinateVariable(data)
+        subsets = [SpatialCoordinateVariable(data[i:i + 2]) for i in range(data.size - 1)]
+        offsets = variable.get_offsets_for_subsets(subsets)
+        assert offsets.tolist() == list(range(data.size - 1))
+        assert offsets.tolist() == [variable.get_offset_for_subset(subset) for subset in subsets]
+
+    with pytest.raises(ValueError):
+        variable.get_offsets_for_subsets([SpatialCoordinateVariable(numpy.array([2.4]))])
+
+
 def test_BoundsCoordinateVariable():
     bounds = numpy.array(((0, 1), (1, 2)))
     variable = BoundsCoordinateVariable(bounds)
@@ -72,6 +130,22 @@ def test_BoundsCoordinateVariable():
         if os.path.exists(outfilename):
             os.remove(outfilename)
 
+    with pytest.raises(NotImplementedError):
+        variable.slice_by_range(0.5, 1.5)
+
+
+def test_string_CoordinateVariable():
+    variable = CoordinateVariable(numpy.array([b'a', b'bc', b'def']))
+    outvarname = 'name'
+    outfilename = 'test.nc'
+    try:
+        with Dataset(outfilename, 'w') as target_ds:
+            variable.add_to_dataset(target_ds, outvarname)
+            assert target_ds.variables[outvarname][:].tolist() == ['a', 'bc', 'def']
+    finally:
+        if os.path.exists(outfilename):
+            os.remove(outfilename)
+
 
 def test_SpatialCoordinateVariable():
     # Ascending
@@ -116,6 +190,10 @@ def test_SpatialCoordinateVariables_slice_by_bbox():
     assert subset.y.values[0] == 16
     assert subset.y.values[-1] == 4
 
+    # Subsets are views of the original values
+    assert numpy.shares_memory(subset.x.values, lon.values)
+    assert numpy.shares_memory(subset.y.values, lat.values)
+
 
 def test_SpatialCoordinateVariables_add_to_dataset():
     lat = SpatialCoordinateVariable(numpy.arange(19, -1, -1))
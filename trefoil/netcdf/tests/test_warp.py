@@ -0,0 +1,66 @@
+import numpy
+from affine import Affine
+from netCDF4 import Dataset
+from pyproj import Proj
+from rasterio.crs import CRS
+
+from trefoil.geometry.bbox import BBox
+from trefoil.netcdf.crs import set_crs
+from trefoil.netcdf.variable import SpatialCoordinateVariables
+from trefoil.netcdf.warp import warp_array, is_identity_warp, warp_like
+
+
+def test_identity_warp():
+    transform = Affine(0.5, 0, -120, 0, -0.5, 45)
+    crs = CRS.from_epsg(4326)
+    assert is_identity_warp((10, 20), crs, transform, 'EPSG:4326', Affine(0.5, 0, -120, 0, -0.5, 45 + 1e-12), (10, 20))
+    assert not is_identity_warp((10, 20), crs, transform, crs, transform * Affine.translation(1, 0), (10, 20))
+    assert not is_identity_warp((10, 20), crs, transform, CRS.from_epsg(3857), transform, (10, 20))
+
+    data = numpy.ma.masked_array(numpy.arange(200, dtype=numpy.float32).reshape(10, 20), fill_value=-1)
+    data[0, 0] = numpy.ma.masked
+    out = warp_array(data, crs, transform, crs, transform, data.shape)
+    assert numpy.ma.allequal(out, data)
+    assert numpy.array_equal(out.mask, numpy.ma.getmaskarray(data))
+    assert not numpy.shares_memory(out, data)
+
+    out = warp_array(data, crs, transform, crs, transform, data.shape, return_masked=False)
+    assert not numpy.ma.isMaskedArray(out)
+    assert out[0, 0] == -1
+
+
+def test_warp_array_bands():
+    src_transform = Affine(0.5, 0, -120, 0, -0.5, 45)
+    dst_transform = Affine(0.25, 0, -119, 0, -0.25, 44)
+    crs = CRS.from_epsg(4326)
+    data = numpy.ma.masked_array(numpy.arange(600, dtype=numpy.int16).reshape(3, 10, 20), fill_value=-1)
+    data[1, 2:4] = numpy.ma.masked
+
+    # All bands are warped at once, with the same results as warping each band
+    out = warp_array(data, crs, src_transform, crs, dst_transform, (3, 12, 16))
+    for band in range(data.shape[0]):
+        expected = warp_array(data[band], crs, src_transform, crs, dst_transform, (12, 16))
+        assert numpy.ma.allequal(out[band], expected)
+        assert numpy.array_equal(out[band].mask, expected.mask)
+
+
+def test_warp_like_netcdf3(tmpdir):
+    # Variables in NETCDF3 files are not chunked; chunking() returns None for them
+    projection = Proj('EPSG:4326')
+    coords = SpatialCoordinateVariables.from_bbox(BBox((-120, 40, -115, 45), projection), 20, 10)
+    data = numpy.arange(600, dtype=numpy.float32).reshape(3, 10, 20)
+
+    with Dataset(str(tmpdir.join('test.nc')), 'w', format='NETCDF3_CLASSIC') as ds:
+        coords.add_to_dataset(ds, 'lon', 'lat')
+        ds.createDimension('time', 3)
+        variable = ds.createVariable('data', 'float32', ('time', 'lat', 'lon'), fill_value=-1)
+        variable[:] = data
+        set_crs(ds, 'data', projection)
+        template = ds.createVariable('template', 'int16', ('lat', 'lon'), fill_value=0)
+        template[:] = 1
+        set_crs(ds, 'template', projection)
+
+    with Dataset(str(tmpdir.join('test.nc'))) as ds, Dataset(str(tmpdir.join('out.nc')), 'w') as out_ds:
+        assert ds.variables['data'].chunking() is None
+        warp_like(ds, 'EPSG:4326', ['data'], out_ds, ds, 'template')
+        assert numpy.array_equal(out_ds.variables['data'][:], data)
@@ -26,6 +26,19 @@ def get_fill_value_for_variable(variable):
     return get_fill_value(variable.dtype)
 
 
+def get_chunk_shape(shape, chunk_size=512):
+    """
+    Returns chunk sizes for a variable with the given shape: tiles of up to chunk_size along the last 2 (spatial)
+    dimensions, and one index along any other dimensions.
+
+    :param shape: shape of the variable
+    :param chunk_size: maximum height and width of each chunk
+    :return: tuple of chunk sizes, suitable for chunksizes parameter of createVariable
+    """
+
+    return tuple(1 for _ in shape[:-2]) + tuple(max(min(s, chunk_size), 1) for s in shape[-2:])
+
+
 def get_dtype_string(variable):
     dtype = str(variable.dtype)
     if "'" in dtype:
@@ -6,7 +6,6 @@ import pytz
 from affine import Affine
 from netCDF4 import num2date, date2num, Variable
 from pyproj import Proj
-import six
 
 from trefoil.geometry.bbox import BBox
 from trefoil.utilities.proj import is_latlong
@@ -15,10 +14,46 @@ from trefoil.netcdf.utilities import get_ncattrs
 from trefoil.netcdf.crs import PROJ4_GEOGRAPHIC
 
 
+# Tolerances used to match coordinate values despite precision errors (same as numpy.isclose() defaults)
+RTOL = 1e-05
+ATOL = 1e-08
+
+
+def is_close(a, b):
+    """ Scalar equivalent of numpy.isclose(), without the overhead of numpy for single values """
+
+    return abs(a - b) <= ATOL + RTOL * abs(b)
+
+
+def bisect_near(values, value, hint):
+    """
+    Equivalent to bisect_left(values, value), but first checks if the result is hint (e.g., the result of the previous
+    search), and otherwise only searches the values on the side of hint where the result must be.  Consecutive
+    searches for neighboring ranges (e.g., tiles) usually land on or next to the previous result.
+
+    :param values: list of values in ascending order
+    :param value: value to search for
+    :param hint: index where the result is likely to be
+    :return: index where value would be inserted to maintain order
+    """
+
+    if 0 < hint < len(values):
+        if values[hint - 1] < value:
+            if value <= values[hint]:
+                return hint
+            return bisect_left(values, value, lo=hint + 1)
+        return bisect_left(values, value, hi=hint - 1)
+
+    return bisect_left(values, value)
+
+
 class CoordinateVariable(object):
     """
     Wraps a one-dimensional variable with the same name as a dimension
     (http://www.unidata.ucar.edu/software/netcdf/docs/BestPractices.html).
+
+    Values are read-only.  When created from a numpy array, values are a read-only view of that array rather than a
+    copy, so the array must not be modified afterward.  Replace values instead of altering them in place.
     """
 
     def __init__(self, input):
@@ -28,21 +63,67 @@ class CoordinateVariable(object):
         :param input: variable in a netCDF dataset or a numpy array
         """
 
-        self._ncattrs = dict()
-
         if isinstance(input, Variable):
             self.values = input[:]
-            for attr in input.ncattrs():
-                if not attr == '_FillValue':
-                    self._ncattrs[attr] = input.getncattr(attr)
+            self._ncattrs = {attr: input.getncattr(attr) for attr in input.ncattrs() if attr != '_FillValue'}
         else:
-            self.values = input[:].copy()
+            self._ncattrs = dict()
+
+            # Use a view of the array rather than copying it; values are never modified in place
+            values = numpy.asanyarray(input)[:]
+            values.setflags(write=False)
+            self.values = values
+
+    @property
+    def values(self):
+        return self._values
+
+    @values.setter
+    def values(self, values):
+        self._values = values
+
+        # Order and range of values are calculated on first use, and reset whenever values are replaced
+        self._is_ascending = None
+        self._range = None
+        self._search_array = None
+        self._search_values = None
+        self._last_positions = (0, 0)  # Start and stop positions of the last search, as hints for the next one
 
     def __len__(self):
         return self.values.shape[0]
 
+    def _get_range(self):
+        """ Return (min, max) of values """
+
+        if self._range is None:
+            self._range = (self.values.min(), self.values.max())
+        return self._range
+
+    def _get_search_array(self):
+        """
+        Return values in ascending order as a contiguous array, for searches of many values using numpy.searchsorted().
+        Descending values are reversed once, rather than searched through a reversed view on every call.
+        """
+
+        if self._search_array is None:
+            values = numpy.ma.getdata(self.values)
+            self._search_array = values if self.is_ascending_order() else numpy.ascontiguousarray(values[::-1])
+        return self._search_array
+
+    def _get_search_values(self):
+        """
+        Return values in ascending order as a list, for binary searches of single values using bisect, which is much
+        faster than numpy.searchsorted() for scalars.
+        """
+
+        if self._search_values is None:
+            self._search_values = self._get_search_array().tolist()
+        return self._search_values
+
     def is_ascending_order(self):
-        return self.values[0] < self.values[1]
+        if self._is_ascending is None:
+            self._is_ascending = bool(self.values[0] < self.values[1])
+        return self._is_ascending
 
     def indices_for_range(self, start, stop):
         """
@@ -54,37 +135,106 @@ class CoordinateVariable(object):
 
         assert stop > start
 
-        if start > self.values.max():
+        indices = self._compute_slice(start, stop)
+        if indices is not None:
+            return indices[0], indices[1] - 1
+
+        min_value, max_value = self._get_range()
+        if start > max_value:
             return self.values.size - 1, self.values.size - 1
-        elif stop < self.values.min():
+        elif stop < min_value:
             return 0, 0
 
-        if self.is_ascending_order():
-            start_index = min(self.values.searchsorted(start), self.values.size - 1)
+        # Range only touches the first or last value
+        return self._search_range(start, stop)
+
+    def _compute_slice(self, start, stop):
+        """
+        Returns the start and stop indices to slice values between the start and stop values, checking the range of
+        values only once.
+
+        :param start: start value
+        :param stop: stop value
+        :return: start and stop (exclusive) indices, or None if the range does not overlap values
+        """
 
-            # Need to move 1 index to the left unless we matched an index closely (allowing for precision errors)
-            if start_index > 0 and not numpy.isclose(start, self.values[start_index]):
-                start_index -= 1
+        min_value, max_value = self._get_range()
+        if start >= max_value or stop <= min_value:
+            return None
 
-            stop_index = min(self.values.searchsorted(stop), self.values.size - 1)
-            if not numpy.isclose(stop, self.values[stop_index]) and stop < self.values[stop_index]:
-                stop_index -= 1
+        start_index, stop_index = self._search_range(start, stop)
+        return start_index, stop_index + 1
 
+    def _search_range(self, start, stop):
+        """ Returns the indices for the start and stop values, without checking the range of values """
+
+        # Search values are always ascending (reversed if values are descending)
+        values = self._get_search_values()
+        last_index = len(values) - 1
+
+        start_position = bisect_near(values, start, self._last_positions[0])
+        stop_position = bisect_near(values, stop, self._last_positions[1])
+        self._last_positions = (start_position, stop_position)
+
+        start_index = min(start_position, last_index)
+
+        # Need to move 1 index to the left unless we matched an index closely (allowing for precision errors)
+        if start_index > 0 and not is_close(start, values[start_index]):
+            start_index -= 1
+
+        stop_index = min(stop_position, last_index)
+        if not is_close(stop, values[stop_index]) and stop < values[stop_index]:
+            stop_index -= 1
+
+        if self.is_ascending_order():
             return start_index, stop_index
-        else:
-            # If values are not ascending, they need to be reversed
-            temp = self.values[::-1]
-            start_index = min(temp.searchsorted(start), temp.size - 1)
 
-            if start_index > 0 and not numpy.isclose(start, temp[start_index]):
-                start_index -= 1
+        # Convert indices in reversed search values back to indices in values
+        return max(last_index - stop_index, 0), max(last_index - start_index, 0)
+
+    def indices_for_ranges(self, starts, stops):
+        """
+        Returns the indices in this variable for many start and stop values at once.  Equivalent to calling
+        indices_for_range() for each pair of start and stop values.
+
+        :param starts: array of start values
+        :param stops: array of stop values
+        :return: arrays of start and stop indices
+        """
 
-            stop_index = min(temp.searchsorted(stop), temp.size - 1)
-            if not numpy.isclose(stop, temp[stop_index]) and stop < temp[stop_index]:
-                stop_index -= 1
+        starts = numpy.asarray(starts)
+        stops = numpy.asarray(stops)
+        assert (stops > starts).all()
 
-            size = self.values.size - 1
-            return max(size - stop_index, 0), max(size - start_index, 0)
+        values = self._get_search_array()
+        last_index = values.size - 1
+
+        start_indices = numpy.minimum(values.searchsorted(starts), last_index)
+        # Need to move 1 index to the left unless we matched an index closely (allowing for precision errors)
+        start_indices = numpy.where(
+            (start_indices > 0) & ~numpy.isclose(starts, values[start_indices]), start_indices - 1, start_indices
+        )
+
+        stop_indices = numpy.minimum(values.searchsorted(stops), last_index)
+        stop_values = values[stop_indices]
+        stop_indices = numpy.where(
+            ~numpy.isclose(stops, stop_values) & (stops < stop_values), stop_indices - 1, stop_indices
+        )
+
+        if not self.is_ascending_order():
+            start_indices, stop_indices = (
+                numpy.maximum(last_index - stop_indices, 0), numpy.maximum(last_index - start_indices, 0)
+            )
+
+        min_value, max_value = self._get_range()
+        above = starts > max_value
+        below = (stops < min_value) & ~above
+        start_indices[above] = last_index
+        stop_indices[above] = last_index
+        start_indices[below] = 0
+        stop_indices[below] = 0
+
+        return start_indices, stop_indices
 
     def slice_by_range(self, start, stop):
         """
@@ -95,11 +245,12 @@ class CoordinateVariable(object):
         :return: sliced view of self.values.  Make sure to copy this before altering it!
         """
         assert stop > start
-        if start >= self.values.max() or stop <= self.values.min():
-            return numpy.array([])
 
-        start_index, stop_index = self.indices_for_range(start, stop)
-        return self.values[start_index:stop_index+1]
+        indices = self._compute_slice(start, stop)
+        if indices is None:
+            return self.values[:0]
+
+        return self.values[indices[0]:indices[1]]
 
     def add_to_dataset(self, dataset, name, is_unlimited=False, **kwargs):
         """
@@ -127,15 +278,14 @@ class CoordinateVariable(object):
                 kwargs['fill_value'] = fill_value
 
         if self.values.dtype.char == 'S':
-            variable = dataset.createVariable(name, 'string', (name,), **kwargs)
-            # Have to write each index at a time, and cast to string.  Not optimal but seems to be the only way allowed by netCDF4.
-            for index, value in enumerate(self.values):
-                variable[index] = str(value)
+            variable = dataset.createVariable(name, str, (name,), **kwargs)
+            # Variable length strings must be written from an object array, which can be done in a single write
+            variable[:] = self.values.astype(str).astype(object)
         else:
             variable = dataset.createVariable(name, self.values.dtype, (name,), **kwargs)
             variable[:] = self.values[:]
 
-        for att, value in six.iteritems(self._ncattrs):
+        for att, value in self._ncattrs.items():
             variable.setncattr(att, value)
 
         return variable
@@ -156,6 +306,12 @@ class BoundsCoordinateVariable(CoordinateVariable):
     def indices_for_range(self, start, stop):
         raise NotImplementedError("Not yet implemented")
 
+    def indices_for_ranges(self, starts, stops):
+        raise NotImplementedError("Not yet implemented")
+
+    def _compute_slice(self, start, stop):
+        raise NotImplementedError("Not yet implemented")
+
     def add_to_dataset(self, dataset, name, is_unlimited=False, **kwargs):
         """
         :param dataset: name of the dataset to add the dimension and variable to
@@ -190,7 +346,7 @@ class BoundsCoordinateVariable(CoordinateVariable):
         variable = dataset.createVariable(name, self.values.dtype, (name,bounds_dimension_name), **kwargs)
         variable[:] = self.values[:]
 
-        for att, value in six.iteritems(self._ncattrs):
+        for att, value in self._ncattrs.items():
             variable.setncattr(att, value)
 
         return variable
@@ -202,17 +358,41 @@ class SpatialCoordinateVariable(CoordinateVariable):
     Assumes that pixels follow a regular grid, and that dimension values represent centroids
     """
 
+    @CoordinateVariable.values.setter
+    def values(self, values):
+        CoordinateVariable.values.fset(self, values)
+        self._pixel_size = None
+        self._index_by_value = None
+
+    def _get_index_by_value(self):
+        """ Return a dictionary of the first index of each value, for lookups of values not on a regular grid """
+
+        if self._index_by_value is None:
+            values = numpy.ma.getdata(self.values).tolist()
+            # Assigned in reverse order, so that the first index of repeated values is kept
+            self._index_by_value = dict(zip(reversed(values), range(len(values) - 1, -1, -1)))
+        return self._index_by_value
+
+    def _get_range(self):
+        """ Return (min, max) of values.  Values are monotonic, so only the ends need to be checked. """
+
+        if self._range is None:
+            self._range = (min(self.values[0], self.values[-1]), max(self.values[0], self.values[-1]))
+        return self._range
+
     @property
     def min(self):
-        return self.values.min()
+        return self._get_range()[0]
 
     @property
     def max(self):
-        return self.values.max()
+        return self._get_range()[1]
 
     @property
     def pixel_size(self):
-        return float(abs(self.values[1] - self.values[0]))
+        if self._pixel_size is None:
+            self._pixel_size = float(abs(self.values[1] - self.values[0]))
+        return self._pixel_size
 
     @property
     def edges(self):
@@ -220,13 +400,17 @@ class SpatialCoordinateVariable(CoordinateVariable):
         Return coordinates of pixel edges from the min to the max
         """
 
-        pixel_size = self.pixel_size
+        half_pixel_size = self.pixel_size / 2.0
 
+        # Edges are written directly into a single output array, rather than appending and then shifting values
+        edges = numpy.empty(self.values.shape[0] + 1, dtype=numpy.result_type(self.values.dtype, half_pixel_size))
         if self.is_ascending_order():
-            temp = numpy.append(self.values, self.values[-1] + pixel_size)
+            numpy.subtract(self.values, half_pixel_size, out=edges[:-1])
+            edges[-1] = self.values[-1] + half_pixel_size
         else:
-            temp = numpy.append(self.values[0] + pixel_size, self.values)
-        return temp - (pixel_size / 2.0)
+            numpy.subtract(self.values, half_pixel_size, out=edges[1:])
+            edges[0] = self.values[0] + half_pixel_size
+        return edges
 
     def get_offset_for_subset(self, coordinate_variable):
         """
@@ -236,7 +420,53 @@ class SpatialCoordinateVariable(CoordinateVariable):
 
         assert len(coordinate_variable) <= self.values.shape[0]
         #TODO: make this a fuzzy match within a certain decimal precision
-        return list(self.values).index(coordinate_variable.values[0])
+        value = coordinate_variable.values[0]
+
+        # Values are on a regular grid, so the offset can be calculated directly (and then verified)
+        if self.values.shape[0] > 1:
+            offset = numpy.rint((value - self.values[0]) / (self.values[1] - self.values[0]))
+            if 0 <= offset < self.values.shape[0] and self.values[int(offset)] == value:
+                return int(offset)
+
+        # Otherwise, look up the value
+        offset = self._get_index_by_value().get(value.item() if hasattr(value, 'item') else value)
+        if offset is None:
+            raise ValueError('{0} is not in coordinate values'.format(value))
+        return offset
+
+    def get_offsets_for_subsets(self, coordinate_variables):
+        """
+        Find the offset indices of many coordinate variables within this coordinate variable.  Equivalent to calling
+        get_offset_for_subset() for each coordinate variable, but offsets are calculated all at once.
+
+        :param coordinate_variables: list of coordinate variables that are subsets of this one
+        :return: array of offset indices
+        """
+
+        assert all(len(coordinate_variable) <= self.values.shape[0] for coordinate_variable in coordinate_variables)
+
+        values = numpy.array([coordinate_variable.values[0] for coordinate_variable in coordinate_variables])
+        offsets = numpy.zeros(values.shape[0], dtype='int64')
+        matched = numpy.zeros(values.shape[0], dtype=bool)
+
+        # Values are on a regular grid, so the offsets can be calculated directly (and then verified)
+        if self.values.shape[0] > 1:
+            with numpy.errstate(invalid='ignore'):
+                estimates = numpy.rint((values - self.values[0]) / (self.values[1] - self.values[0]))
+            in_bounds = (estimates >= 0) & (estimates < self.values.shape[0])
+            offsets[in_bounds] = estimates[in_bounds]
+            matched = in_bounds & (numpy.ma.getdata(self.values)[offsets] == values)
+
+        # Otherwise, look up the values
+        if not matched.all():
+            index_by_value = self._get_index_by_value()
+            for i in numpy.flatnonzero(~matched).tolist():
+                offset = index_by_value.get(values[i].item())
+                if offset is None:
+                    raise ValueError('{0} is not in coordinate values'.format(values[i]))
+                offsets[i] = offset
+
+        return offsets
 
 
 class SpatialCoordinateVariables(object):
@@ -330,19 +560,15 @@ class SpatialCoordinateVariables(object):
         x_pixel_size = (bbox.xmax - bbox.xmin) / float(x_size)
         y_pixel_size = (bbox.ymax - bbox.ymin) / float(y_size)
 
-        x_arr = numpy.arange(x_size, dtype=dtype)
-        x_arr *= x_pixel_size
-        x_arr += (bbox.xmin + x_pixel_size / 2.0)
+        # Pixel centers are filled in a single pass, from the centers of the first and last pixels
+        x_arr = numpy.linspace(bbox.xmin + x_pixel_size / 2.0, bbox.xmax - x_pixel_size / 2.0, x_size, dtype=dtype)
 
+        y_min_center = bbox.ymin + y_pixel_size / 2.0
+        y_max_center = bbox.ymax - y_pixel_size / 2.0
         if y_ascending:
-            y_arr = numpy.arange(y_size, dtype=dtype)
-            y_arr *= y_pixel_size
-            y_arr += (bbox.ymin + y_pixel_size / 2.0)
-
+            y_arr = numpy.linspace(y_min_center, y_max_center, y_size, dtype=dtype)
         else:
-            y_arr = numpy.arange(0, -y_size, -1, dtype=dtype)
-            y_arr *= y_pixel_size
-            y_arr += (bbox.ymax - y_pixel_size / 2.0)
+            y_arr = numpy.linspace(y_max_center, y_min_center, y_size, dtype=dtype)
 
         x = SpatialCoordinateVariable(x_arr)
         y = SpatialCoordinateVariable(y_arr)
@@ -375,8 +601,8 @@ class SpatialCoordinateVariables(object):
     def slice_by_bbox(self, bbox):
         assert isinstance(bbox, BBox)
 
-        x_half_pixel_size = float(self.x.pixel_size)/2
-        y_half_pixel_size = float(self.y.pixel_size)/2
+        x_half_pixel_size = self.x.pixel_size / 2.0
+        y_half_pixel_size = self.y.pixel_size / 2.0
 
         # Note: this is very sensitive to decimal precision.
         x = SpatialCoordinateVariable(
@@ -418,13 +644,37 @@ class SpatialCoordinateVariables(object):
 
         assert isinstance(bbox, BBox)
 
-        y_half_pixel_size = float(self.y.pixel_size)/2
-        x_half_pixel_size = float(self.x.pixel_size)/2
+        y_half_pixel_size = self.y.pixel_size / 2.0
+        x_half_pixel_size = self.x.pixel_size / 2.0
 
         y_offset, y_max = self.y.indices_for_range(bbox.ymin + y_half_pixel_size, bbox.ymax - y_half_pixel_size)
         x_offset, x_max =  self.x.indices_for_range(bbox.xmin + x_half_pixel_size, bbox.xmax - x_half_pixel_size)
         return Window((y_offset, y_max + 1), (x_offset, x_max + 1))
 
+    def get_windows_for_bboxes(self, bboxes):
+        """
+        return Windows representing offsets of each of bboxes within self.  Equivalent to calling get_window_for_bbox()
+        for each bbox, but indices are calculated for all bboxes at once.
+
+        :param bboxes: list of bounding boxes
+        :return: list of Window instances
+        """
+
+        bounds = numpy.array([bbox.as_list() for bbox in bboxes], dtype='float64').reshape(-1, 4)
+        xmin, ymin, xmax, ymax = bounds.T
+
+        y_half_pixel_size = self.y.pixel_size / 2.0
+        x_half_pixel_size = self.x.pixel_size / 2.0
+
+        y_offsets, y_maxs = self.y.indices_for_ranges(ymin + y_half_pixel_size, ymax - y_half_pixel_size)
+        x_offsets, x_maxs = self.x.indices_for_ranges(xmin + x_half_pixel_size, xmax - x_half_pixel_size)
+        return [
+            Window((y_offset, y_max + 1), (x_offset, x_max + 1))
+            for y_offset, y_max, x_offset, x_max in zip(
+                y_offsets.tolist(), y_maxs.tolist(), x_offsets.tolist(), x_maxs.tolist()
+            )
+        ]
+
 
 class DateVariable(CoordinateVariable):
     """
@@ -475,47 +725,62 @@ class DateVariable(CoordinateVariable):
                     date2num(self.dates, units=self.units, calendar=self.calendar), dtype=numpy.int32
                 )
 
+    @property
+    def dates(self):
+        return self._dates
+
+    @dates.setter
+    def dates(self, dates):
+        self._dates = dates
+        self._datetimes = None
+
     @property
     def datetimes(self):
         """
         Convert to python datetimes if not done automatically (calendar not compatible with python datetimes).
-        Use with caution
+        Use with caution.  Converted datetimes are cached until dates are replaced.
         """
 
-        if isinstance(self.dates[0], datetime):
-            return self.dates
-        else:
-            return numpy.array([datetime(*d.timetuple()[:6], tzinfo=pytz.UTC) for d in self.dates])
+        if self._datetimes is None:
+            if isinstance(self.dates[0], datetime):
+                self._datetimes = self.dates
+            else:
+                self._datetimes = numpy.array([datetime(*d.timetuple()[:6], tzinfo=pytz.UTC) for d in self.dates])
+        return self._datetimes
 
     @property
     def unit(self):
-        def varies_by_year(x, y):
-            if y.year == x.year or (y - x).seconds != 0 or x.month != y.month or x.day != y.day:
-                return False
-
-            return True
-
-        def varies_by_month(x, y):
-            if x.month == y.month or (y - x).seconds != 0 or x.day != y.day:
-                return False
-
-            return True
-
         datetimes = self.datetimes if not self.values.dtype == datetime else self.values
 
-        if all(varies_by_year(datetimes[i], datetimes[i-1]) for i in range(1, len(datetimes))):
+        # Fields are extracted once, so that consecutive dates can be compared all at once.  Time of day is in
+        # microseconds.
+        fields = numpy.array(
+            [
+                (d.year, d.month, d.day, ((d.hour * 60 + d.minute) * 60 + d.second) * 1000000 + d.microsecond)
+                for d in datetimes
+            ],
+            dtype='int64'
+        ).reshape(-1, 4)
+        years, months, days, times = fields.T
+
+        # Equivalent to (previous - current).seconds == 0
+        same_time = ((times[:-1] - times[1:]) // 1000000) % 86400 == 0
+        same_day = same_time & (days[1:] == days[:-1])
+        same_month = months[1:] == months[:-1]
+
+        if (same_day & same_month & (years[1:] != years[:-1])).all():
             return 'year'
-        elif all(varies_by_month(datetimes[i], datetimes[i-1]) for i in range(1, len(datetimes))):
+        elif (same_day & ~same_month).all():
             return 'month'
 
-        deltas = datetimes[1:] - datetimes[:-1]
+        # Equivalent to (current - previous).seconds
+        seconds = ((times[1:] - times[:-1]) // 1000000) % 86400
 
-        for unit, seconds in (('day', 86400), ('hour', 3600), ('minute', 60), ('second', 1)):
-            if any(x.seconds % seconds != 0 for x in deltas):
-                continue
-            break
+        for unit, unit_seconds in (('day', 86400), ('hour', 3600), ('minute', 60)):
+            if not (seconds % unit_seconds).any():
+                return unit
 
-        return unit
+        return 'second'
 
     def add_to_dataset(self, dataset, name, **kwargs):
         variable = super(DateVariable, self).add_to_dataset(dataset, name, **kwargs)
@@ -539,4 +804,7 @@ class DateVariable(CoordinateVariable):
         if not isinstance(stop, date):
             stop = date(stop, 12, 31)
 
-        return numpy.searchsorted(self.dates, start), numpy.searchsorted(self.dates, stop)
+        return bisect_left(self.dates, start), bisect_left(self.dates, stop)
+
+    def _search_range(self, start, stop):
+        return self.indices_for_range(start, stop)
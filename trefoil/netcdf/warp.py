@@ -1,8 +1,12 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy
 from pyproj import Proj
 import click
 import rasterio
 from rasterio.crs import CRS
+from rasterio.env import GDALVersion
 from rasterio.warp import reproject
 from rasterio.enums import Resampling
 
@@ -11,6 +15,25 @@ from trefoil.netcdf.utilities import copy_variable, copy_dimension, get_fill_val
 from trefoil.netcdf.variable import SpatialCoordinateVariables
 
 
+# Maximum size (in bytes) of source and warped data held in memory at a time when warping variables with > 2 dimensions
+MAX_WARP_SIZE = 256 * 1024 * 1024
+
+# GDAL 3.7+ warps signed 8 bit data directly; older versions require upcasting it
+SUPPORTS_INT8 = GDALVersion.runtime().at_least('3.7')
+
+def is_identity_warp(src_shape, src_crs, src_transform, dst_crs, dst_transform, dst_shape):
+    """
+    Return True if the source and destination grids are the same, so that warping between them would not change the
+    data.  Transforms are compared within a small tolerance.
+    """
+
+    return (
+        tuple(src_shape) == tuple(dst_shape) and
+        src_transform.almost_equals(dst_transform, precision=1e-9) and
+        CRS.from_user_input(src_crs) == CRS.from_user_input(dst_crs)
+    )
+
+
 def warp_array(
     arr,
     src_crs,
@@ -18,34 +41,48 @@ def warp_array(
     dst_crs,
     dst_transform,
     dst_shape,
-    resampling=Resampling.nearest):
+    resampling=Resampling.nearest,
+    num_threads=1,
+    warp_mem_limit=0,
+    return_masked=True):
 
     """
-    Warp a 2D array using rasterio, always returning a masked array.
+    Warp a 2D array, or a 3D array of bands, using rasterio, returning a masked array by default.  All bands of a 3D
+    array are warped together in a single call to GDAL.
 
     A fill_value will be chosen from the array's data type if the input is not a masked array (beware conflicts with
     valid values!)
 
     All nodata values are filled in prior to warping, and masked back out later if necessary.
 
-    :param dst_shape: shape of destination array
+    :param dst_shape: shape of destination array (including number of bands for a 3D array)
+    :param num_threads: number of threads GDAL uses for the reprojection
+    :param warp_mem_limit: memory limit (in MB) for GDAL to warp the array; larger limits warp in fewer chunks.
+    0 uses the GDAL default.
+    :param return_masked: if False, return the warped data as a regular array, with nodata areas set to the fill value,
+    instead of creating a mask for them
 
     All other parameters are the same as for rasterio.warp.reproject
     """
 
+    fill = get_fill_value(arr.dtype)
+    if hasattr(arr, 'fill_value'):
+        fill = arr.fill_value
+        arr = numpy.ma.filled(arr, arr.fill_value)
+
+    if is_identity_warp(arr.shape, src_crs, src_transform, dst_crs, dst_transform, dst_shape):
+        # Warping to the same grid does not change any values
+        out = arr.copy()
+        return numpy.ma.masked_array(out, mask=out == fill) if return_masked else out
+
     with rasterio.Env():
         orig_dtype = arr.dtype
-        if arr.dtype == numpy.int8:
+        if arr.dtype == numpy.int8 and not SUPPORTS_INT8:
             # Have to upcast for rasterio
             arr = arr.astype('int16')
 
         out = numpy.empty(shape=dst_shape, dtype=arr.dtype)
 
-        fill = get_fill_value(arr.dtype)
-        if hasattr(arr, 'fill_value'):
-            fill = arr.fill_value
-            arr = numpy.ma.filled(arr, arr.fill_value)
-
         reproject(
             arr,
             out,
@@ -55,29 +92,29 @@ def warp_array(
             dst_transform=dst_transform,
             resampling=resampling,
             src_nodata=fill,
-            dst_nodata=fill
+            dst_nodata=fill,
+            num_threads=num_threads,
+            warp_mem_limit=warp_mem_limit
         )
 
         if out.dtype != orig_dtype:
             out = out.astype(orig_dtype)
 
-        out = numpy.ma.masked_array(out, mask=out == fill)
+        if return_masked:
+            out = numpy.ma.masked_array(out, mask=out == fill)
 
         return out
 
 
 
-def warp_like(ds, ds_projection, variables, out_ds, template_ds, template_varname, resampling=Resampling.nearest):
+def extract_template_grid(template_ds, template_varname):
     """
-    Warp one or more variables in a NetCDF file based on the coordinate reference system and
-    spatial domain of a template NetCDF file.
-    :param ds: source dataset
-    :param ds_projection: source dataset coordiante reference system, proj4 string or EPSG:NNNN code
-    :param variables: list of variable names in source dataset to warp
-    :param out_ds: output dataset.  Must be opened in write or append mode.
+    Extract the spatial grid of a template variable, so that it can be reused across many calls to warp_like
+    without re-reading coordinates, projection, and mask from the template dataset each time.
+
     :param template_ds: template dataset
     :param template_varname: variable name for template data variable in template dataset
-    :param resampling: resampling method.  See rasterio.enums.Resampling for options
+    :return: tuple of (dimensions, SpatialCoordinateVariables, pyproj Proj, mask)
     """
 
     template_variable = template_ds.variables[template_varname]
@@ -91,6 +128,33 @@ def warp_like(ds, ds_projection, variables, out_ds, template_ds, template_varnam
         y_name=template_y_name,
         projection=template_prj
     )
+
+    return template_variable.dimensions, template_coords, template_prj, template_mask
+
+
+def warp_like(ds, ds_projection, variables, out_ds, template_ds, template_varname, resampling=Resampling.nearest,
+              template_grid=None, num_threads=1, num_workers=1):
+    """
+    Warp one or more variables in a NetCDF file based on the coordinate reference system and
+    spatial domain of a template NetCDF file.
+    :param ds: source dataset
+    :param ds_projection: source dataset coordiante reference system, proj4 string or EPSG:NNNN code
+    :param variables: list of variable names in source dataset to warp
+    :param out_ds: output dataset.  Must be opened in write or append mode.
+    :param template_ds: template dataset
+    :param template_varname: variable name for template data variable in template dataset
+    :param resampling: resampling method.  See rasterio.enums.Resampling for options
+    :param template_grid: (optional) result of extract_template_grid for template_ds; if provided, the template
+    grid is not re-read from template_ds.  Use this when warping many datasets against the same template.
+    :param num_threads: number of threads GDAL uses for each reprojection
+    :param num_workers: number of variables to warp in parallel (separate threads).  Reads and writes are serialized,
+    so this only helps when reprojection dominates.  Use num_threads = cores / num_workers to avoid oversubscription.
+    """
+
+    if template_grid is None:
+        template_grid = extract_template_grid(template_ds, template_varname)
+
+    template_dimensions, template_coords, template_prj, template_mask = template_grid
     # template_geo_bbox = template_coords.bbox.project(ds_prj, edge_points=21)  # TODO: add when needing to subset
 
     ds_y_name, ds_x_name = ds.variables[variables[0]].dimensions[-2:]
@@ -99,18 +163,26 @@ def warp_like(ds, ds_projection, variables, out_ds, template_ds, template_varnam
 
     with rasterio.Env():
         # Copy dimensions for variable across to output
-        for dim_name in template_variable.dimensions:
+        for dim_name in template_dimensions:
             if not dim_name in out_ds.dimensions:
                 if dim_name in template_ds.variables and not dim_name in out_ds.variables:
                     copy_variable(template_ds, out_ds, dim_name)
                 else:
                     copy_dimension(template_ds, out_ds, dim_name)
 
+        # Output variables are created and blocks are planned up front, since the netCDF library can only be used from
+        # one thread at a time.  Only reprojection (in GDAL) runs in parallel.
+        num_workers = max(min(num_workers, len(variables)), 1)
+        # CRS objects are the same for all variables, so they are only created once
+        src_crs = CRS.from_string(ds_projection)
+        dst_crs = CRS.from_user_input(template_prj.srs)
+        max_warp_size = MAX_WARP_SIZE // num_workers
+        tasks = []
         for variable_name in variables:
-            click.echo('Processing: {0}'.format(variable_name))
-
             variable = ds.variables[variable_name]
-            fill_value = getattr(variable, '_FillValue', variable[0, 0].fill_value)
+            fill_value = getattr(variable, '_FillValue', None)
+            if fill_value is None:
+                fill_value = get_fill_value(variable.dtype)
 
             for dim_name in variable.dimensions[:-2]:
                 if not dim_name in out_ds.dimensions:
@@ -122,40 +194,83 @@ def warp_like(ds, ds_projection, variables, out_ds, template_ds, template_varnam
             out_var = out_ds.createVariable(
                 variable_name,
                 variable.dtype,
-                dimensions=variable.dimensions[:-2] + template_variable.dimensions,
+                dimensions=variable.dimensions[:-2] + template_dimensions,
                 fill_value=fill_value
             )
 
             reproject_kwargs = {
                 'src_transform': ds_coords.affine,
-                'src_crs': CRS.from_string(ds_projection),
+                'src_crs': src_crs,
                 'dst_transform': template_coords.affine,
-                'dst_crs': template_prj.srs,
+                'dst_crs': dst_crs,
                 'resampling': resampling,
                 'src_nodata': fill_value,
                 'dst_nodata': fill_value,
-                'threads': 4
+                'num_threads': num_threads
             }
 
             # TODO: may only need to select out what is in window
 
+            # Slices along the first dimension (if any) are read and warped together in blocks, as bands, so that GDAL
+            # only sets up the warp once per block.  rasterio wraps the arrays as multi-band in-memory datasets itself,
+            # so they do not need to be copied into a MemoryFile first.  Blocks are aligned to chunks of the variable, if it is chunked.
             if len(variable.shape) == 3:
-                idxs = range(variable.shape[0])
-                with click.progressbar(idxs) as bar:
-                    for i in bar:
-                        # print('processing slice: {0}'.format(i))
-
-                        data = variable[i, :]
-                        out = numpy.ma.empty(template_coords.shape, dtype=data.dtype)
-                        out.mask = template_mask
-                        out.fill(fill_value)
-                        reproject(data, out, **reproject_kwargs)
-                        out_var[i, :] = out
+                slice_size = variable.dtype.itemsize * (
+                    int(numpy.prod(variable.shape[1:])) + int(numpy.prod(template_coords.shape))
+                )
+                step = max(max_warp_size // slice_size, 1)
+                chunks = variable.chunking()
+                if chunks not in (None, 'contiguous'):  # None for NETCDF3 files
+                    step = max(step // chunks[0], 1) * chunks[0]
+                blocks = [slice(i, i + step) for i in range(0, variable.shape[0], step)]
+                out_shape = (min(step, variable.shape[0]), ) + template_coords.shape
+            else:
+                blocks = [slice(None)]
+                out_shape = template_coords.shape
+
+            tasks.append((variable_name, variable, out_var, fill_value, reproject_kwargs, blocks, out_shape))
+
+        lock = threading.Lock()
+        buffers = threading.local()
+
+        def warp_variable(variable_name, variable, out_var, fill_value, reproject_kwargs, blocks, out_shape):
+            click.echo('Processing: {0}'.format(variable_name))
 
+            # Progress over slices is only shown when variables are warped one at a time
+            if num_workers == 1 and len(out_shape) == 3:
+                with click.progressbar(blocks) as bar:
+                    warp_blocks(variable, out_var, fill_value, reproject_kwargs, bar, out_shape)
             else:
-                data = variable[:]
-                out = numpy.ma.empty(template_coords.shape, dtype=data.dtype)
-                out.mask = template_mask
-                out.fill(fill_value)
-                reproject(data, out, **reproject_kwargs)
-                out_var[:] = out
+                warp_blocks(variable, out_var, fill_value, reproject_kwargs, blocks, out_shape)
+
+        def warp_blocks(variable, out_var, fill_value, reproject_kwargs, blocks, out_shape):
+            for block in blocks:
+                with lock:
+                    data = numpy.ma.filled(variable[block], fill_value)
+
+                # The output array and its mask are reused for blocks and variables with the same shape and type (per
+                # thread).  The output does not need to be filled first, since reproject initializes it to dst_nodata.
+                out = getattr(buffers, 'out', None)
+                if out is None or out.shape != out_shape or out.dtype != data.dtype:
+                    buffers.out = out = numpy.empty(out_shape, dtype=data.dtype)
+                    buffers.mask = numpy.broadcast_to(template_mask, out_shape)
+                out_mask = buffers.mask
+
+                # Last block may be smaller than the others
+                block_out = out[:data.shape[0]] if len(out_shape) == 3 else out
+                block_mask = out_mask[:data.shape[0]] if len(out_shape) == 3 else out_mask
+
+                reproject(data, block_out, **reproject_kwargs)
+                with lock:
+                    out_var[block] = numpy.ma.masked_array(block_out, mask=block_mask)
+
+        if num_workers == 1:
+            for task in tasks:
+                warp_variable(*task)
+
+        else:
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                futures = [executor.submit(warp_variable, *task) for task in tasks]
+                for future in futures:
+                    # Re-raise any errors from worker threads
+                    future.result()
@@ -31,6 +31,15 @@ class RasterRenderer(object):
         self.values = numpy.array([entry[0] for entry in self.colormap])
         self._generate_palette()
 
+        # Palette of images (including the background color) is the same for every image, so it is only created once.
+        # Stored as bytes, which PIL uses directly.  The background color is always the last entry.
+        self._background_index = int(self.palette.shape[0])
+        self._is_background_transparent = self.background_color.alpha == 0
+        self._image_palette = (
+            numpy.ascontiguousarray(self.palette[..., :3], dtype=numpy.uint8).tobytes() +
+            bytes(self.background_color.to_tuple()[:3])
+        )
+
     @property
     def name(self):
         return self.__class__.__name__.lower().replace('renderer', '').replace('values', '')
@@ -60,19 +69,19 @@ class RasterRenderer(object):
         """
         Creates image, setting background color into image and palette
         """
-        background_index = self.palette.shape[0]
         if hasattr(image_data, 'mask'):
-            image_data = image_data.filled(background_index)
+            image_data = image_data.filled(self._background_index)
 
-        image = Image.frombuffer("P", size, image_data, "raw", "P", 0, 1)
+        # PIL can only wrap contiguous uint8 data without copying it (no-op if image_data is already contiguous uint8)
+        image_data = numpy.ascontiguousarray(image_data, dtype=numpy.uint8)
+        if image_data.size != size[0] * size[1]:
+            raise ValueError('Image data of shape {0} does not match image size {1}'.format(image_data.shape, size))
 
-        palette = self.palette[..., :3].flatten().tolist()
-        # Append background color
-        palette.extend(self.background_color.to_tuple()[:3])
-        image.putpalette(palette, "RGB")
+        image = Image.frombuffer("P", size, image_data, "raw", "P", 0, 1)
+        image.putpalette(self._image_palette, "RGB")
 
-        if self.background_color.alpha == 0:
-            image.info['transparency'] = background_index
+        if self._is_background_transparent:
+            image.info['transparency'] = self._background_index
 
         return image
 
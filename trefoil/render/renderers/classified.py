@@ -7,6 +7,9 @@ from trefoil.render.renderers.legend import LegendElement
 
 LEGEND_TICK_POSITION = 0.5  # center-aligned with legend image
 
+# Number of values classified at a time, to limit the size of intermediate index arrays
+CLASSIFY_BLOCK_SIZE = 65536
+
 
 class ClassifiedRenderer(RasterRenderer):
     def __init__(self, colormap, fill_value=None, background_color=None):
@@ -36,20 +39,24 @@ class ClassifiedRenderer(RasterRenderer):
         legend_elements = []
         num_breaks = len(self.values)
 
+        # Breaks are formatted once.  The last break (often inf) is not used in labels unless it is the only one.
+        break_labels = formatter.format_array(self.values[:num_breaks - 1] if num_breaks > 1 else self.values)
+        colors = self.palette.tolist()
+
         for index in range(0, num_breaks):
-            img = Image.new("RGBA", (image_width, image_height), tuple(self.palette[index]))
+            img = Image.new("RGBA", (image_width, image_height), tuple(colors[index]))
             if index == 0:
                 if min_value is not None:
-                    label = "%s - %s" % (formatter.format(min_value), formatter.format(self.values[0]))
+                    label = "%s - %s" % (formatter.format(min_value), break_labels[0])
                 else:
-                    label = "<= %s" % formatter.format(self.values[0])
+                    label = "<= %s" % break_labels[0]
             elif index == (num_breaks - 1):
                 if max_value is not None:
-                    label = "%s - %s" % (formatter.format(self.values[index-1]), formatter.format(max_value))
+                    label = "%s - %s" % (break_labels[index-1], formatter.format(max_value))
                 else:
-                    label = "> %s" % formatter.format(self.values[index-1])
+                    label = "> %s" % break_labels[index-1]
             else:
-                label = "%s - %s" % (formatter.format(self.values[index-1]), formatter.format(self.values[index]))
+                label = "%s - %s" % (break_labels[index-1], break_labels[index])
             legend_elements.append(LegendElement(
                 img,
                 [LEGEND_TICK_POSITION],
@@ -60,7 +67,14 @@ class ClassifiedRenderer(RasterRenderer):
 
     def render_image(self, data, row_major_order=True):
         values = self._mask_fill_value(data.ravel())
-        classified = numpy.digitize(values, self.values).astype(numpy.uint8)
+
+        # Equivalent to numpy.digitize(values, self.values), since breaks are sorted.  Blocks are written directly into the
+        # output, instead of creating a full size index array and then casting it.
+        classified = numpy.empty(values.shape, dtype=numpy.uint8)
+        for start in range(0, values.size, CLASSIFY_BLOCK_SIZE):
+            stop = start + CLASSIFY_BLOCK_SIZE
+            classified[start:stop] = numpy.searchsorted(self.values, values.data[start:stop], side='right')
+
         image_data = numpy.ma.masked_array(classified, mask=values.mask)
 
         # have to invert dimensions because PIL thinks about this backwards
@@ -74,7 +74,7 @@ class StretchedRenderer(RasterRenderer):
             if abs(value_range) > 0:
                 for value in tick_values:
                     tick_positions.append((value - self.min_value) / value_range)
-                    labels.append(formatter.format(value))
+                labels = formatter.format_array(tick_values)
             else:
                 tick_positions = [0, 1.0]
                 labels = [formatter.format(tick_values[0])] * 2
@@ -103,22 +103,46 @@ class StretchedRenderer(RasterRenderer):
 
     # TODO: handle cropping of stretched values properly (truncate above and below and set to background value?)
     def render_image(self, data, row_major_order=True):
-        num_colors = self.palette.shape[0]
-        if self.min_value == self.max_value:
-            factor = 1.0
-        else:
-            factor = float(num_colors - 1) / float(self.max_value - self.min_value)
-
         values = self._mask_fill_value(data.ravel())
 
-        # derive palette index, and clip to [0, num_colors - 1]
-        stretched = ((values - self.min_value) * factor).astype(numpy.int)
-        image_data = stretched.clip(0, num_colors - 1).astype(numpy.uint8)
+        if values.dtype.kind in ('i', 'u') and values.dtype.itemsize <= 2:
+            # Look up palette indices for all possible values of the data type, indexed by the unsigned representation
+            # of values (a view of the data, not a copy)
+            stretched = self._get_stretch_table(values.dtype)[values.data.view('u{0}'.format(values.dtype.itemsize))]
+        else:
+            stretched = self._stretch(values.data)
+
+        image_data = numpy.ma.masked_array(stretched, mask=values.mask)
 
         # have to invert dimensions because PIL thinks about this backwards
         size = data.shape[::-1] if row_major_order else data.shape[:2]
         return self._create_image(image_data, size)
 
+    def _stretch(self, values):
+        """
+        Return palette indices of values (not masked), clipped to [0, num_colors - 1]
+        """
+
+        # This is done in place in a single buffer, rather than creating a new array for each step.  fmax / fmin also
+        # set NaN to 0.  float32 data are stretched in float32, which is precise enough for palette indices.
+        dtype = numpy.float32 if values.dtype == numpy.float32 else numpy.float64
+        stretched = numpy.subtract(values, dtype(self.min_value), dtype=dtype)
+        stretched *= dtype(self._stretch_factor)
+        numpy.fmax(stretched, 0, out=stretched)
+        numpy.fmin(stretched, self.palette.shape[0] - 1, out=stretched)
+        return stretched.astype(numpy.uint8)
+
+    def _get_stretch_table(self, dtype):
+        """
+        Return palette indices of all possible values of an 8 or 16 bit integer type, ordered by the unsigned
+        representation of each value.  Tables are only calculated once per type.
+        """
+
+        if dtype not in self._stretch_tables:
+            unsigned = numpy.arange(2 ** (8 * dtype.itemsize), dtype='u{0}'.format(dtype.itemsize))
+            self._stretch_tables[dtype] = self._stretch(unsigned.view(dtype))
+        return self._stretch_tables[dtype]
+
     def _generate_palette(self):
         self.min_value = self.colormap[0][0]
         self.max_value = self.colormap[len(self.colormap)-1][0]
@@ -129,6 +153,14 @@ class StretchedRenderer(RasterRenderer):
         else:
             raise NotImplementedError("Other stretched render methods not built!")
 
+        # Stretch depends only on the palette and value range, so it is calculated once for all images
+        num_colors = self.palette.shape[0]
+        if self.min_value == self.max_value:
+            self._stretch_factor = 1.0
+        else:
+            self._stretch_factor = float(num_colors - 1) / float(self.max_value - self.min_value)
+        self._stretch_tables = {}
+
     def serialize(self):
         ret = super(StretchedRenderer, self).serialize()
 
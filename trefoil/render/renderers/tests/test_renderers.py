@@ -4,7 +4,7 @@ from trefoil.utilities.color import Color
 from trefoil.render.renderers.stretched import StretchedRenderer
 from trefoil.render.renderers.classified import ClassifiedRenderer
 from trefoil.render.renderers.unique import UniqueValuesRenderer
-from trefoil.render.renderers.utilities import get_renderer_by_name
+from trefoil.render.renderers.utilities import get_renderer_by_name, renderer_from_dict
 
 
 def test_stretched_renderer(tmpdir):
@@ -127,3 +127,33 @@ def test_get_renderers_by_name():
     img = renderer.render_image(data)
     assert img.palette.palette == b'\xff\x00\x00\x00\xff\x00\x00\x00\xff\x00\x00\x00'
     assert img.size == (100, 100)
+
+
+def test_uniquevalues_renderer_float_values():
+    data = numpy.array([[0.5, 1.25, 2.0], [1.25, 3.0, numpy.nan]], dtype=numpy.float32)
+    colors = (
+        (0.5, Color(255, 0, 0, 255)),
+        (1.25, Color(0, 255, 0, 255)),
+        (2.0, Color(0, 0, 255, 255))
+    )
+    renderer = UniqueValuesRenderer(colors)
+
+    img = renderer.render_image(data)
+    # Values that are not in the colormap are set to the background index
+    assert list(img.getdata()) == [0, 1, 2, 1, 3, 3]
+
+
+def test_renderer_from_dict():
+    renderer_dict = {
+        'type': 'classified',
+        'colors': [(10, '#F00'), (50.5, '#00ff00'), (100, '0000FF80')],
+        'options': {'fill_value': -1}
+    }
+    renderer = renderer_from_dict(renderer_dict)
+
+    assert isinstance(renderer, ClassifiedRenderer)
+    assert renderer.fill_value == -1
+    assert [value for value, _ in renderer.colormap] == [10, 50.5, 100]
+    assert [color.to_tuple() for _, color in renderer.colormap] == [
+        (255, 0, 0, 255), (0, 255, 0, 255), (0, 0, 255, 128)
+    ]
@@ -32,11 +32,11 @@ class UniqueValuesRenderer(RasterRenderer):
             labels = self.labels
         else:
             formatter = PrecisionFormatter(self.values)
-            labels = [formatter.format(x) for x in self.values]
+            labels = formatter.format_array(self.values)
 
-        for index, value in enumerate(self.values):
+        for index, color in enumerate(self.palette.tolist()):
             legend_elements.append(LegendElement(
-                Image.new("RGBA", (image_width, image_height), tuple(self.palette[index])),
+                Image.new("RGBA", (image_width, image_height), tuple(color)),
                 [LEGEND_TICK_POSITION],
                 [labels[index]]
             ))
@@ -45,18 +45,20 @@ class UniqueValuesRenderer(RasterRenderer):
     def render_image(self, data, row_major_order=True):
         values = self._mask_fill_value(data.ravel())
 
-        max_value = max(values.max(), self.values.max())
-        if values.dtype.kind == 'u' and max_value < 65536:
-            palette_indices = numpy.zeros(max_value + 1, dtype=numpy.uint8)
-            palette_indices.fill(self.values.shape[0])
-            for index, value in enumerate(self.values):
-                palette_indices.itemset(value, index)
-            image_data = palette_indices[values].astype(numpy.uint8)
+        if values.dtype.kind == 'u' and values.dtype.itemsize <= 2:
+            # Lookup table of palette indices covers all possible values of the data type, so the data do not need to be
+            # scanned for their max value first
+            palette_indices = numpy.full(numpy.iinfo(values.dtype).max + 1, self.values.shape[0], dtype=numpy.uint8)
+            in_table = (self.values >= 0) & (self.values < palette_indices.shape[0]) & (self.values % 1 == 0)
+            palette_indices[self.values[in_table].astype(numpy.intp)] = numpy.flatnonzero(in_table)
+            image_data = numpy.ma.masked_array(palette_indices[values.data], mask=values.mask)
         else:
-            image_data = numpy.zeros(values.shape, dtype=numpy.uint8)
-            image_data.fill(self.values.shape[0])
-            for index, value in enumerate(self.values):
-                image_data[values == value] = index
+            # Values are sorted, so the palette index of each value can be found in a single pass.  Values that are not
+            # in the colormap (or are masked) are set to the background index.
+            indices = numpy.searchsorted(self.values, values.data).clip(0, self.values.shape[0] - 1)
+            unmatched = (self.values[indices] != values.data) | numpy.ma.getmaskarray(values)
+            image_data = indices.astype(numpy.uint8)
+            image_data[unmatched] = self.values.shape[0]
 
          # have to invert dimensions because PIL thinks about this backwards
         size = data.shape[::-1] if row_major_order else data.shape[:2]
@@ -2,7 +2,7 @@ import six
 from trefoil.render.renderers.classified import ClassifiedRenderer
 from trefoil.render.renderers.stretched import StretchedRenderer
 from trefoil.render.renderers.unique import UniqueValuesRenderer
-from trefoil.utilities.color import Color
+from trefoil.utilities.color import Color, ColorArray
 
 
 AVAILABLE_RENDERERS = {
@@ -11,20 +11,24 @@ AVAILABLE_RENDERERS = {
     "unique": UniqueValuesRenderer
 }
 
+RENDERER_NAMES = {renderer_class: name for name, renderer_class in AVAILABLE_RENDERERS.items()}
+
 
 def get_renderer_by_name(name):
     return AVAILABLE_RENDERERS[name]
 
 
 def get_renderer_name(renderer):
-    if isinstance(renderer, ClassifiedRenderer):
-        return "classified"
-    elif isinstance(renderer, StretchedRenderer):
-        return "stretched"
-    elif isinstance(renderer, UniqueValuesRenderer):
-        return "unique"
-    else:
-        raise ValueError("Could not find name for renderer: %s" % renderer)
+    name = RENDERER_NAMES.get(type(renderer))
+    if name is not None:
+        return name
+
+    # Subclasses of available renderers
+    for renderer_class, name in RENDERER_NAMES.items():
+        if isinstance(renderer, renderer_class):
+            return name
+
+    raise ValueError("Could not find name for renderer: %s" % renderer)
 
 
 def renderer_from_dict(renderer_dict):
@@ -34,7 +38,11 @@ def renderer_from_dict(renderer_dict):
 
     try:
         renderer_type = renderer_dict['type']
-        renderer_colors = [(float(x[0]), Color.from_hex(x[1])) for x in renderer_dict['colors']]
+        colors = renderer_dict['colors']
+        # Hex colors are parsed together, rather than one at a time
+        renderer_colors = list(zip(
+            [float(x[0]) for x in colors], ColorArray.from_hex_list([x[1] for x in colors]).to_colors()
+        ))
         fill_value = options.get('fill_value')
         if fill_value is not None:
             fill_value = float(fill_value)
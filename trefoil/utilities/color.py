@@ -1,16 +1,32 @@
-import bisect
 import colorsys
 import numpy
-import six
 
 #TODO: cleanup usage
 NUM_COLORS = 255
 
+# Factors to convert integer colors to floating point [0, 1], by number of bits
+FLOAT_FACTORS = {bits: 1.0 / float(2**bits - 1) for bits in (8, 16, 32)}
+
+# Index into (v, t, p, q) of the red, green, and blue components for each sector of hue in HSV to RGB conversion.  The
+# last sector is for greys.
+HSV_SECTOR_COMPONENTS = numpy.array((
+    (0, 1, 2),
+    (3, 0, 2),
+    (2, 0, 1),
+    (2, 3, 0),
+    (1, 2, 0),
+    (0, 2, 3),
+    (0, 0, 0)
+), dtype=numpy.intp)
+
 class Color(object):
     """
     convenience class that represents integer colors of 8, 16, 32 bits each
     """
 
+    # Palettes can have hundreds of colors, so instances do not have a __dict__
+    __slots__ = ('red', 'green', 'blue', 'alpha', '_has_alpha', 'bits')
+
     def __init__(self, red, green, blue, alpha=None, bits=8):
         assert isinstance(red, int) and isinstance(green, int) and isinstance(blue, int)
         assert bits in (8, 16, 32)
@@ -37,20 +53,20 @@ class Color(object):
         return tuple(values)
 
     def to_hex(self):
-        s = ''.join('{:02x}'.format(x) for x in (self.red, self.green, self.blue))
+        red, green, blue = self.red, self.green, self.blue
 
-        # Use short form if possible
-        if all((s[i] == s[i+1] for i in (0, 2, 4))):
-            s = ''.join((s[0], s[2], s[4]))
+        # Use short form if possible (both digits of each channel are equal)
+        if red % 17 == 0 and green % 17 == 0 and blue % 17 == 0:
+            return '#{0:X}{1:X}{2:X}'.format(red // 17, green // 17, blue // 17)
 
-        return '#{0}'.format(s).upper()
+        return '#{0:02X}{1:02X}{2:02X}'.format(red, green, blue)
 
     def to_float(self):
-        factor = 1.0 / float(2**self.bits - 1)
-        values = [getattr(self,x) * factor for x in ('red', 'green','blue')]
+        factor = FLOAT_FACTORS[self.bits]
+        values = (self.red * factor, self.green * factor, self.blue * factor)
         if self._has_alpha:
-            values.append(self.alpha * factor)
-        return tuple(values)
+            return values + (self.alpha * factor, )
+        return values
 
     def to_hsv(self):
         """
@@ -78,10 +94,11 @@ class Color(object):
         if alpha is not None:
             assert isinstance(alpha, int)
 
-        #Convert to and from float used by colorsys functions
-        red, green, blue = [int(round(x * (2**bits - 1), 0)) for x
-                            in colorsys.hsv_to_rgb(float(hue) / 360.0, float(saturation) / 100.0, float(value) / 100.0)]
-        return Color(red, green, blue, alpha=alpha, bits=bits)
+        #Convert to and from float used by colorsys functions.  round() without digits rounds the same way, but
+        # returns an int directly.
+        scale = 2**bits - 1
+        red, green, blue = colorsys.hsv_to_rgb(hue / 360.0, saturation / 100.0, value / 100.0)
+        return Color(round(red * scale), round(green * scale), round(blue * scale), alpha=alpha, bits=bits)
 
     @classmethod
     def from_hex(cls, value, alpha=None):
@@ -95,16 +112,100 @@ class Color(object):
             if len(value) != 8:
                 raise ValueError
 
-            color = []
-            for i in range(0, 8, 2):
-                color.append(int(value[i:i+2], 16))
-
-            return cls(*color)
+            # Parse all 4 bytes at once
+            red, green, blue, alpha = bytes.fromhex(value)
+            return cls(red, green, blue, alpha)
 
         except ValueError:
             raise ValueError("Invalid hex color: {}".format(value))
 
 
+class ColorArray(object):
+    """
+    Array of 8-bit RGBA colors, stored as a single (n, 4) uint8 numpy array instead of a Color object per color.  Use
+    this for palettes that are converted to and from arrays.
+    """
+
+    __slots__ = ('colors', )
+
+    def __init__(self, colors):
+        """
+        :param colors: array-like of (r, g, b) or (r, g, b, a) 8-bit colors.  Alpha defaults to 255.
+        """
+
+        colors = numpy.asarray(colors, dtype=numpy.uint8)
+        assert len(colors.shape) == 2 and colors.shape[1] in (3, 4)
+
+        if colors.shape[1] == 3:
+            colors = numpy.column_stack((colors, numpy.full(colors.shape[0], 255, dtype=numpy.uint8)))
+
+        self.colors = numpy.ascontiguousarray(colors)
+
+    def __len__(self):
+        return self.colors.shape[0]
+
+    def __getitem__(self, index):
+        return Color(*self.colors[index].tolist())
+
+    @classmethod
+    def from_colors(cls, colors):
+        return cls([color.to_tuple()[:3] + (255 if color.alpha is None else color.alpha, ) for color in colors])
+
+    @classmethod
+    def from_hex_list(cls, values, alpha=None):
+        """
+        Construct from hex colors, in any form accepted by Color.from_hex.  All colors are parsed in a single call.
+        """
+
+        alpha_hex = '{0:02X}'.format(alpha if alpha is not None else 255)
+        normalized = []
+        for value in values:
+            if value[:1] == '#':
+                value = value[1:]
+            if len(value) == 3:
+                value = ''.join([c*2 for c in value])
+            if len(value) == 6:
+                value += alpha_hex
+            normalized.append(value)
+
+        try:
+            colors = bytes.fromhex(''.join(normalized))
+            # Whitespace is ignored by bytes.fromhex, so invalid colors may still parse into the wrong number of bytes
+            if any(len(value) != 8 for value in normalized) or len(colors) != 4 * len(normalized):
+                raise ValueError
+
+        except ValueError:
+            # Raise the error for the first invalid color
+            for value in values:
+                Color.from_hex(value, alpha=alpha)
+            raise
+
+        return cls(numpy.frombuffer(colors, dtype=numpy.uint8).reshape(-1, 4))
+
+    def to_colors(self):
+        return [Color(*color) for color in self.colors.tolist()]
+
+    def to_hex(self):
+        """
+        Return hex strings (without alpha) for all colors, using the same short forms as Color.to_hex
+        """
+
+        # Short form is possible if both digits of each channel are equal
+        short = (self.colors[:, :3] % 17 == 0).all(axis=1).tolist()
+        return [
+            '#{0:X}{1:X}{2:X}'.format(r // 17, g // 17, b // 17) if is_short else
+            '#{0:02X}{1:02X}{2:02X}'.format(r, g, b)
+            for (r, g, b, _), is_short in zip(self.colors.tolist(), short)
+        ]
+
+    def to_hsv(self):
+        """
+        Return floating point HSV values of all colors (see rgb_to_hsv)
+        """
+
+        return rgb_to_hsv(self.colors[:, :3])
+
+
 
 def rgb_to_hsv(colors):
     """
@@ -121,29 +222,32 @@ def rgb_to_hsv(colors):
     assert len(colors.shape) == 2 and colors.shape[-1] == 3
     assert colors.dtype == numpy.uint8
 
+    # Colors are often a slice of RGBA colors, which is copied once so that all operations below read contiguous data
+    colors = numpy.ascontiguousarray(colors)
+
+    # Max, min, and the max channel (the last one, if tied) are found on the 8-bit colors, before converting them,
+    # since scaling does not change their order
+    vmax = colors.max(-1) / 255.0
+    vrange = colors.min(-1) / 255.0
+    numpy.subtract(vmax, vrange, out=vrange)
+    max_channel = 2 - colors[..., ::-1].argmax(-1)
+
     colors = colors / 255.0
-    hsv = numpy.zeros_like(colors)
-    vmax = colors.max(-1)
-    vrange = colors.ptp(-1)
-    vmax_ge_zero = vmax > 0
+    red, green, blue = colors[..., 0], colors[..., 1], colors[..., 2]
+
     s = numpy.zeros_like(vmax)
-    s[vmax_ge_zero] = vrange[vmax_ge_zero] / vmax[vmax_ge_zero]
+    numpy.divide(vrange, vmax, out=s, where=vmax > 0)
 
-    vrange_ge_zero = vrange > 0
-    # red is max
-    idx = (colors[..., 0] == vmax) & vrange_ge_zero
-    hsv[idx, 0] = (colors[idx, 1] - colors[idx, 2]) / vrange[idx]
-    # green is max
-    idx = (colors[..., 1] == vmax) & vrange_ge_zero
-    hsv[idx, 0] = 2. + (colors[idx, 2] - colors[idx, 0]) / vrange[idx]
-    # blue is max
-    idx = (colors[..., 2] == vmax) & vrange_ge_zero
-    hsv[idx, 0] = 4. + (colors[idx, 0] - colors[idx, 1]) / vrange[idx]
+    # Hue is calculated from whichever channel is max, in a single pass instead of separate masked writes for each
+    # channel
+    hue = numpy.choose(max_channel, (green - blue, blue - red, red - green))
+    numpy.divide(hue, vrange, out=hue, where=vrange > 0)
+    hue += max_channel * 2.
+    hue[vrange == 0] = 0
+    hue /= 6.0
+    hue %= 1.0
 
-    hsv[..., 0] = (hsv[..., 0] / 6.0) % 1.0
-    hsv[..., 1] = s
-    hsv[..., 2] = vmax
-    return hsv
+    return numpy.stack((hue, s, vmax), axis=-1)
 
 
 def hsv_to_rgb(colors):
@@ -161,50 +265,22 @@ def hsv_to_rgb(colors):
     assert len(colors.shape) == 2 and colors.shape[-1] == 3
     assert colors.dtype.kind == 'f'
 
-    h, s, v = colors.T
-    rgb = numpy.zeros_like(colors)
-    r, g, b = rgb.T
-
-    i = (h * 6.0).astype(numpy.int)
-    f = (h * 6.0) - i
+    # Each channel is used several times, so channels are made contiguous once (no copy if colors are transposed from
+    # separate channels, as in interpolate_linear)
+    h, s, v = [numpy.ascontiguousarray(colors[..., i]) for i in range(3)]
+    h6 = h * 6.0
+    i = h6.astype(int)
+    f = h6 - i
     p = v * (1.0 - s)
     q = v * (1.0 - s * f)
     t = v * (1.0 - s * (1.0 - f))
 
-    idx = i % 6 == 0
-    r[idx] = v[idx]
-    g[idx] = t[idx]
-    b[idx] = p[idx]
-
-    idx = i == 1
-    r[idx] = q[idx]
-    g[idx] = v[idx]
-    b[idx] = p[idx]
-
-    idx = i == 2
-    r[idx] = p[idx]
-    g[idx] = v[idx]
-    b[idx] = t[idx]
-
-    idx = i == 3
-    r[idx] = p[idx]
-    g[idx] = q[idx]
-    b[idx] = v[idx]
-
-    idx = i == 4
-    r[idx] = t[idx]
-    g[idx] = p[idx]
-    b[idx] = v[idx]
-
-    idx = i == 5
-    r[idx] = v[idx]
-    g[idx] = p[idx]
-    b[idx] = q[idx]
-
-    idx = s == 0
-    r[idx] = v[idx]
-    g[idx] = v[idx]
-    b[idx] = v[idx]
+    # All channels are gathered from (v, t, p, q) at once by the sector of the hue, instead of separate masked writes
+    # for each sector.  Greys (no saturation) are in an extra sector.
+    sector = i % 6
+    sector[s == 0] = 6
+    components = numpy.stack((v, t, p, q), axis=-1)
+    rgb = numpy.take_along_axis(components, HSV_SECTOR_COMPONENTS[sector], axis=-1)
 
     return (rgb * 255).astype(numpy.uint8)
 
@@ -213,13 +289,15 @@ def interpolate_linear(colors, values, num_colors, colorspace="hsv"):
     """
     Interpolates colors based on the positions of values.
 
-    :param colors: the numpy array (must be uint8) of colors to interpolate between.
+    :param colors: the numpy array (must be uint8) or ColorArray of colors to interpolate between.
     :param values: the values that correspond to the colors (order must match).  Used to determine the position of each color w/in interpolation.
     :param num_colors: number of new colors to create.
     :param colorspace: hsv or rgb, determines the colorspace of the interpolation method
     """
 
-    if not isinstance(colors, numpy.ndarray):
+    if isinstance(colors, ColorArray):
+        colors = colors.colors
+    elif not isinstance(colors, numpy.ndarray):
         colors = numpy.asarray(colors).astype(numpy.uint8)
 
     assert len(colors.shape) == 2
@@ -227,59 +305,88 @@ def interpolate_linear(colors, values, num_colors, colorspace="hsv"):
     assert len(colors) == len(values)
     assert colors.dtype == numpy.uint8
 
-    min_value = min(values)
-    value_range = max(values) - min_value
+    values = numpy.asarray(values, dtype=numpy.float64)
+    min_value = values.min()
+    value_range = values.max() - min_value
     if value_range == 0:
         factor = 1.0
     else:
         factor = float(num_colors-1) / value_range
 
-    target_x = numpy.arange(0, num_colors)
-    x = []
-    for value in values:
-        x.append((value - min_value) * factor)
+    target_x = numpy.arange(num_colors, dtype=numpy.float64)
+    x = (values - min_value) * factor
+
+    if num_colors == colors.shape[0] and numpy.array_equal(x, target_x):
+        # Colors are already evenly spaced at every target position, so there is nothing to interpolate
+        return colors.copy()
 
     if colorspace == "rgb":
-        src_colors = colors.T
-        target_colors = numpy.zeros((src_colors.shape[0], num_colors))
-        for i in range(0, target_colors.shape[0]):
-            target_colors[i] = numpy.interp(target_x, x, src_colors[i])
-        return target_colors.T.astype(numpy.uint8)
+        # Channels are interpolated directly into the output colors (truncated to uint8), without transposing
+        target_colors = numpy.empty((num_colors, colors.shape[1]), dtype=numpy.uint8)
+        for i in range(0, colors.shape[1]):
+            target_colors[:, i] = numpy.interp(target_x, x, colors[:, i])
+        return target_colors
     else:
-        hsv = rgb_to_hsv(colors[..., :3]).T
-
-        target_hsv = numpy.zeros((hsv.shape[0], num_colors))
-
-        # Interpolate saturation and value
-        for i in range(1, target_hsv.shape[0]):
-            target_hsv[i] = numpy.interp(target_x, x, hsv[i])
+        if (colors[:, 0] == colors[:, 1]).all() and (colors[:, 1] == colors[:, 2]).all():
+            # Greys have no hue or saturation, so only their value needs to be interpolated.  This is the same result as
+            # interpolating in HSV and converting back.
+            value = numpy.interp(target_x, x, colors[:, 0] / 255.0)
+            rgb = (numpy.repeat(value[:, numpy.newaxis], 3, axis=1) * 255).astype(numpy.uint8)
+        else:
+            rgb = hsv_to_rgb(_interpolate_hsv(colors[..., :3], x, target_x).T)
 
-        # Interpolate hue separately, since it has some special conditions
-        for i in six.moves.range(1, len(hsv[0])):
-            lo_h = hsv[0][i-1]
-            hi_h = hsv[0][i]
-            lo_s = hsv[1][i-1]
-            hi_s = hsv[1][1]
-            lo_x = x[i-1]
-            hi_x = x[i]
-            lo_idx = bisect.bisect_left(target_x, lo_x)
-            hi_idx = bisect.bisect_left(target_x, hi_x)
+        if colors.shape[1] == 4:
+            a = numpy.interp(target_x, x, colors[..., 3]).astype(numpy.uint8)
+            return numpy.column_stack((rgb, a))
+        else:
+            return rgb
 
-            # Make sure we interpolate through the last position in palette
-            if hi_idx == len(target_x) - 1:
-                hi_idx = len(target_x)
 
-            # Avoid moving through other colors when ramping from or to a shade of grey.
-            if lo_s == 0:
-                lo_h = hi_h
-            elif hi_s == 0:
-                hi_h = lo_h
+def _interpolate_hsv(colors, x, target_x):
+    """
+    Convert 8-bit RGB colors to HSV, and interpolate them at target_x positions.
 
-            target_hsv[0][lo_idx:hi_idx] = numpy.interp(target_x[lo_idx:hi_idx], [lo_x, hi_x], [lo_h, hi_h])
+    :return: array of interpolated (hue, saturation, value), of shape (3, num_colors)
+    """
 
-        if colors.shape[1] == 4:
-            r, g, b = hsv_to_rgb(target_hsv.T).T
-            a = numpy.interp(target_x, x, colors[..., 3].T).astype(numpy.uint8)
-            return numpy.vstack((r, g, b, a)).T.astype(numpy.uint8)
-        else:
-            return hsv_to_rgb(target_hsv.T).astype(numpy.uint8)
+    num_colors = target_x.shape[0]
+    hsv = rgb_to_hsv(colors).T
+
+    target_hsv = numpy.zeros((hsv.shape[0], num_colors))
+
+    # Interpolate saturation and value
+    for i in range(1, target_hsv.shape[0]):
+        target_hsv[i] = numpy.interp(target_x, x, hsv[i])
+
+    # Interpolate hue separately, since it has some special conditions.  Hue is interpolated within each segment
+    # between colors, rather than between all colors at once.
+    lo_x = x[:-1]
+    hi_x = x[1:]
+    lo_h = hsv[0][:-1].copy()
+    hi_h = hsv[0][1:].copy()
+
+    # Avoid moving through other colors when ramping from or to a shade of grey.
+    lo_grey = hsv[1][:-1] == 0
+    hi_grey = (hsv[1][1:] == 0) & ~lo_grey
+    lo_h[lo_grey] = hi_h[lo_grey]
+    hi_h[hi_grey] = lo_h[hi_grey]
+
+    # Each segment covers positions from its low color up to (not including) its high color.  Make sure we
+    # interpolate through the last position in palette.
+    lo_idx = numpy.searchsorted(target_x, lo_x)
+    hi_idx = numpy.searchsorted(target_x, hi_x)
+    hi_idx[hi_idx == num_colors - 1] = num_colors
+
+    # Positions are assigned to the last segment that starts at or before them
+    segment = numpy.searchsorted(lo_idx, target_x, side='right') - 1
+    in_segment = (segment >= 0) & (target_x < hi_idx[segment.clip(0)])
+    segment = segment[in_segment]
+    segment_x = target_x[in_segment]
+
+    # Same as numpy.interp(segment_x, [lo_x, hi_x], [lo_h, hi_h]) for each segment
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        slope = (hi_h - lo_h)[segment] / (hi_x - lo_x)[segment]
+        hue = slope * (segment_x - lo_x[segment]) + lo_h[segment]
+    target_hsv[0][in_segment] = numpy.where(segment_x >= hi_x[segment], hi_h[segment], hue)
+
+    return target_hsv
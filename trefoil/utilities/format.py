@@ -25,9 +25,22 @@ class PrecisionFormatter(object):
         if max_precision is not None:
             self._precision = min(self._precision, max_precision)
         self._precision = min(self._precision, MAX_PRECISION)
+        self._format_str = "{:.%if}" % self._precision
 
     def format(self, value):
         if self._precision == 0:
             return str(int(round(float(value), 0)))
         else:
-            return ("{:.%if}" % self._precision).format(float(value)).rstrip('0').rstrip('.')
+            return self._format_str.format(float(value)).rstrip('0').rstrip('.')
+
+    def format_array(self, values):
+        """
+        Return a list of formatted strings for all values.  Values are rounded or converted to python floats in a
+        single numpy operation, rather than one at a time.
+        """
+
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if self._precision == 0:
+            return [str(int(x)) for x in numpy.round(values).tolist()]
+        else:
+            return [self._format_str.format(x).rstrip('0').rstrip('.') for x in values.tolist()]
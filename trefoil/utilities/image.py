@@ -1,4 +1,5 @@
-from PIL import Image, ImageDraw, ImageChops
+import numpy
+from PIL import ImageDraw
 
 from trefoil.utilities.color import Color
 
@@ -8,13 +9,10 @@ def add_border(image, width, color):
         color = color.to_tuple()
     color=color[:3]
 
+    # Border is drawn inside the edges of the image, with the same width on all sides
     image_width, image_height = image.size
     canvas = ImageDraw.Draw(image)
-    offset = int(round(width/2.0))
-    canvas.line(((0, 0), (0, image_height)), fill=color, width=width)
-    canvas.line(((0, 0), (image_width, 0)), fill=color, width=width)
-    canvas.line(((0, image_height-offset), (image_width, image_height-offset)), fill=color, width=width)
-    canvas.line(((image_width-offset, 0), (image_width-offset, image_height)), fill=color, width=width)
+    canvas.rectangle(((0, 0), (image_width - 1, image_height - 1)), outline=color, width=width)
 
 
 def autocrop(image, background=None):
@@ -28,12 +26,15 @@ def autocrop(image, background=None):
 
     if not background:
         background = (255, 255, 255, 0)
-
-    background_img = Image.new("RGBA", image.size, color=background)
-    diff = ImageChops.difference(image, background_img)
-    diff = ImageChops.add(diff, diff, 2.0, -100)
-    bbox = diff.getbbox()
-    if bbox:
-        return image.crop(bbox)
+    background_alpha = background[3] if len(background) > 3 else 255
+
+    # Pixels are part of the foreground if their alpha differs from the background by more than 100.  Only the alpha
+    # band is read, and rows and columns are scanned once each, instead of creating difference images.
+    alpha = numpy.asarray(image.getchannel('A'), dtype=numpy.int16)
+    foreground = numpy.abs(alpha - background_alpha) > 100
+    rows = numpy.flatnonzero(foreground.any(axis=1))
+    if rows.size:
+        columns = numpy.flatnonzero(foreground.any(axis=0))
+        return image.crop((int(columns[0]), int(rows[0]), int(columns[-1]) + 1, int(rows[-1]) + 1))
 
     return image
\ No newline at end of file
@@ -1,4 +1,7 @@
-from trefoil.utilities.color import Color
+import numpy
+import pytest
+
+from trefoil.utilities.color import Color, ColorArray, rgb_to_hsv, interpolate_linear
 
 
 def test_color():
@@ -10,3 +13,41 @@ def test_color():
     assert c2.to_tuple() == color_tuple
 
     assert Color.from_hex("#000000", alpha=100)
+    assert Color.from_hex("#12aB9f").to_tuple() == (18, 171, 159, 255)
+    assert Color.from_hex("F00", alpha=10).to_tuple() == (255, 0, 0, 10)
+    with pytest.raises(ValueError):
+        Color.from_hex("#12 34 56")
+
+
+def test_rgb_to_hsv():
+    colors = numpy.array([(255, 0, 0), (255, 255, 0), (0, 0, 255), (255, 0, 255), (51, 51, 51), (0, 0, 0)], dtype='uint8')
+    hsv = rgb_to_hsv(colors)
+    assert numpy.allclose(hsv[:, 0], [0, 1 / 6.0, 4 / 6.0, 5 / 6.0, 0, 0])
+    assert numpy.allclose(hsv[:, 1], [1, 1, 1, 1, 0, 0])
+    assert numpy.allclose(hsv[:, 2], [1, 1, 1, 1, 0.2, 0])
+
+
+def test_color_array():
+    hex_colors = ['#F00', '00ff00', '#0000FF80', '#123456']
+    colors = ColorArray.from_hex_list(hex_colors)
+    assert len(colors) == 4
+    assert colors.colors.tolist() == [[255, 0, 0, 255], [0, 255, 0, 255], [0, 0, 255, 128], [18, 52, 86, 255]]
+    assert [c.to_tuple() for c in colors.to_colors()] == [Color.from_hex(c).to_tuple() for c in hex_colors]
+    assert colors.to_hex() == ['#F00', '#0F0', '#00F', '#123456']
+    assert colors[2].to_tuple() == (0, 0, 255, 128)
+    assert numpy.array_equal(colors.to_hsv(), rgb_to_hsv(colors.colors[:, :3]))
+    assert ColorArray.from_colors(colors.to_colors()).colors.tolist() == colors.colors.tolist()
+
+    with pytest.raises(ValueError):
+        ColorArray.from_hex_list(['#F00', '#12 34 56'])
+
+
+def test_interpolate_linear():
+    colors = numpy.array([(255, 0, 0), (0, 255, 0), (0, 0, 255)], dtype=numpy.uint8)
+    for colorspace in ('hsv', 'rgb'):
+        palette = interpolate_linear(colors, [0, 5, 10], 11, colorspace=colorspace)
+        assert palette.shape == (11, 3)
+        assert palette.dtype == numpy.uint8
+
+        # Colors that are already at every position are returned unchanged
+        assert numpy.array_equal(interpolate_linear(colors, [10, 20, 30], 3, colorspace=colorspace), colors)
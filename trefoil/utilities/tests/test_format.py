@@ -0,0 +1,12 @@
+import numpy
+from trefoil.utilities.format import PrecisionFormatter
+
+
+def test_precision_formatter():
+    values = numpy.array([0, 1.5, 2.25, 10, -3.125])
+    formatter = PrecisionFormatter(values)
+    assert formatter.format(2.25) == '2.25'
+    assert formatter.format_array(values) == ['0', '1.5', '2.25', '10', '-3.125']
+
+    formatter = PrecisionFormatter([1, 2, 3])
+    assert formatter.format_array([1, 2.4, 2.6]) == ['1', '2', '3']